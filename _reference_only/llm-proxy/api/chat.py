@@ -5,19 +5,45 @@ Handles chat completions, streaming, and tool orchestration.
 """
 
 import asyncio
-import json
 import logging
-from typing import Any, Dict, List, Optional
+import os
+from contextlib import AsyncExitStack
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Union
 
+import aiofiles.tempfile
 from fastapi import APIRouter, HTTPException, Request, Form, File, UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
+from sse_starlette.sse import EventSourceResponse
 import litellm
+import orjson
+
+from config import LLMProxyConfig
+from .files import spool_upload, temp_dir_for
 
 logger = logging.getLogger(__name__)
 
 chat_router = APIRouter()
 
+# Default prompts shared by every chat request
+_SYSTEM_PROMPT = "You are a helpful AI assistant with access to various tools."
+_TOOLS_PROMPT = "Use the available tools to help answer user questions accurately."
+
+# SSE events that never change between requests
+_SSE_INIT = {"data": "{}"}
+_SSE_DONE = {"data": "[DONE]"}
+
+# Keep-alive ping interval (seconds) so idle streams survive proxy timeouts
+_SSE_PING_INTERVAL = 15
+
+# Chunks the LLM may produce ahead of a slow client, and the end-of-stream marker
+_STREAM_BUFFER_SIZE = 64
+_STREAM_END = object()
+
+# Maximum number of uploaded files processed at the same time per request
+_MAX_CONCURRENT_UPLOADS = 4
+
 
 class ChatCompletionRequest(BaseModel):
     """Request model for chat completions."""
@@ -36,7 +62,7 @@ class ChatCompletionResponse(BaseModel):
     message_id: Optional[str] = None
 
 
-@chat_router.post("/completions", response_model=ChatCompletionResponse)
+@chat_router.post("/completions")
 async def chat_completion(request: ChatCompletionRequest, req: Request):
     """
     Handle chat completion requests.
@@ -47,42 +73,70 @@ async def chat_completion(request: ChatCompletionRequest, req: Request):
         llm_service = req.app.state.llm_service
         mcp_client = req.app.state.mcp_client
         
-        # Set model if provided
-        if request.model:
-            llm_service.set_model(request.model)
-        
         # Get tools description from MCP service
         tools_description = await mcp_client.get_tools_description()
         
-        # Read system prompts (we'll need to handle this differently in the service)
-        system_prompt = "You are a helpful AI assistant with access to various tools."
-        tools_prompt = "Use the available tools to help answer user questions accurately."
+        # System prompts (we'll need to handle this differently in the service)
+        system_prompt = _SYSTEM_PROMPT
+        tools_prompt = _TOOLS_PROMPT
         
         if request.stream:
             # Return streaming response
-            return StreamingResponse(
+            return EventSourceResponse(
                 _stream_chat_completion(
                     llm_service=llm_service,
                     mcp_client=mcp_client,
                     session_id=request.session_id,
                     message=request.message,
+                    model=request.model,
                     system_prompt=system_prompt,
                     tools_prompt=tools_prompt,
                     tools_description=tools_description,
                     temperature=request.temperature
                 ),
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no"
-                }
+                ping=_SSE_PING_INTERVAL
             )
         else:
+            # Serve repeated informational prompts from the semantic cache
+            semantic_cache = getattr(req.app.state, "semantic_cache", None)
+            cache_context = None
+            if semantic_cache and semantic_cache.enabled and semantic_cache.is_cacheable(request.message):
+                # Scope cached answers to this session's newest messages
+                recent = await req.app.state.message_manager.get_recent_messages(
+                    request.session_id, semantic_cache.history_size
+                )
+                cache_context = semantic_cache.context_key(
+                    request.model or llm_service.model,
+                    system_prompt,
+                    tools_prompt,
+                    tools_description,
+                    request.session_id,
+                    request.temperature,
+                    recent
+                )
+                cache_vector = await semantic_cache.embed(request.message)
+                cached_content = await semantic_cache.lookup(cache_vector, cache_context)
+                if cached_content is not None:
+                    # Persisted the same way chat_completion persists a reply
+                    message_id = await llm_service.persist_reply(
+                        [litellm.Message(role="user", content=request.message)],
+                        cached_content,
+                        session_id=request.session_id,
+                        system_prompt=system_prompt,
+                        tools_prompt=tools_prompt,
+                        tools=tools_description
+                    )
+                    return ORJSONResponse(ChatCompletionResponse(
+                        content=cached_content,
+                        session_id=request.session_id,
+                        message_id=message_id
+                    ).model_dump())
+            
             # Non-streaming response
             response = await llm_service.chat_completion(
+                model=request.model,
                 session_id=request.session_id,
-                persist=True,
+                persistence=True,
                 messages=[litellm.Message(role="user", content=request.message)],
                 system_prompt=system_prompt,
                 tools_prompt=tools_prompt,
@@ -95,34 +149,51 @@ async def chat_completion(request: ChatCompletionRequest, req: Request):
             # Extract response content
             content = response.get("final_response", response.get("response", ""))
             
-            return ChatCompletionResponse(
+            if cache_context is not None and content:
+                await semantic_cache.store(cache_vector, cache_context, content)
+            
+            return ORJSONResponse(ChatCompletionResponse(
                 content=content,
                 session_id=request.session_id,
                 message_id=response.get("message_id")
-            )
+            ).model_dump())
             
     except Exception as e:
         logger.error(f"Error in chat completion: {e}")
         raise HTTPException(status_code=500, detail=f"Chat completion failed: {str(e)}")
 
 
+async def _async_wrap(iterator: Iterable[Any]) -> AsyncIterator[Any]:
+    """Adapt a sync iterator, yielding control to the event loop between items."""
+    for item in iterator:
+        yield item
+        await asyncio.sleep(0)
+
+
 async def _stream_chat_completion(
     llm_service,
     mcp_client,
     session_id: str,
     message: str,
+    model: Optional[str],
     system_prompt: str,
     tools_prompt: str,
     tools_description: str,
     temperature: float
-):
-    """Generator for streaming chat completions."""
+) -> AsyncIterator[Dict[str, str]]:
+    """Generator for streaming chat completions as SSE events.
+    
+    The whole pipeline must stay async: a sync iterator anywhere in it would
+    either block the event loop or be pushed onto the threadpool per chunk.
+    A sync LLM stream is therefore adapted with ``_async_wrap``.
+    """
     try:
         # Yield initial connection
-        yield "data: {}\n\n"
+        yield _SSE_INIT
         
         # Get streaming response from LLM service
-        chat_stream = llm_service.chat_completion(
+        chat_stream: AsyncIterator[Union[str, Dict[str, Any]]] = llm_service.chat_completion(
+            model=model,
             session_id=session_id,
             persist=True,
             messages=[litellm.Message(role="user", content=message)],
@@ -131,20 +202,87 @@ async def _stream_chat_completion(
             tools=tools_description,
             tool_manager=mcp_client,
             temperature=temperature,
-            stream=True
+            stream=True,
+            raw_sse=True
         )
         
-        # Stream chunks
-        async for chunk in chat_stream:
-            yield f"data: {json.dumps(chunk)}\n\n"
+        if not hasattr(chat_stream, "__aiter__"):
+            logger.warning("LLM stream is synchronous; adapting it to an async iterator")
+            chat_stream = _async_wrap(chat_stream)
+        
+        # Let the LLM fill ahead into a bounded buffer while the client drains it
+        queue: asyncio.Queue = asyncio.Queue(maxsize=_STREAM_BUFFER_SIZE)
+        
+        async def _produce():
+            try:
+                async for chunk in chat_stream:
+                    await queue.put(chunk)
+                await queue.put(_STREAM_END)
+            except Exception as e:
+                await queue.put(e)
+        
+        producer = asyncio.create_task(_produce())
+        try:
+            # Stream chunks
+            while (chunk := await queue.get()) is not _STREAM_END:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                # Pre-serialized chunks pass through without JSON work here
+                if isinstance(chunk, str):
+                    yield {"data": chunk}
+                else:
+                    yield {"data": orjson.dumps(chunk).decode()}
+        finally:
+            producer.cancel()
         
         # Signal completion
-        yield "data: [DONE]\n\n"
+        yield _SSE_DONE
         
     except Exception as e:
         logger.error(f"Error in streaming chat completion: {e}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        yield "data: [DONE]\n\n"
+        yield {"data": orjson.dumps({"error": str(e)}).decode()}
+        yield _SSE_DONE
+
+
+def _remove_temp_file(path: str) -> None:
+    """Delete a request-scoped temp file, logging rather than raising on failure."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not clean up temporary file {path}: {e}")
+
+
+async def _process_upload(
+    llm_service,
+    file: UploadFile,
+    cleanup: AsyncExitStack
+) -> str:
+    """Save an uploaded file temporarily and extract its content.
+    
+    The temp file is registered on ``cleanup`` as soon as it exists, so it is
+    removed even if processing fails or the client disconnects. Only the
+    extracted content leaves this function; the temp path is never handed on.
+    
+    Returns:
+        Content for the prompt
+    """
+    async with aiofiles.tempfile.NamedTemporaryFile(
+        "wb", delete=False, dir=temp_dir_for(file)
+    ) as tmp_file:
+        cleanup.callback(_remove_temp_file, tmp_file.name)
+        await spool_upload(file, tmp_file)
+        tmp_file_path = tmp_file.name
+    
+    # Process file content
+    file_result = await llm_service.process_file(
+        tmp_file_path,
+        file.filename,
+        file.content_type
+    )
+    
+    return file_result.get("content", f"[File: {file.filename}]")
 
 
 @chat_router.post("/send-message")
@@ -162,95 +300,79 @@ async def send_message_form(
     This endpoint maintains compatibility with the existing UI forms.
     """
     try:
-        llm_service = request.app.state.llm_service
-        mcp_client = request.app.state.mcp_client
-        
-        # Set model if provided
-        if model:
-            llm_service.set_model(model)
-        
-        # Process file uploads
-        file_attachments = []
-        file_contents = []
-        
-        for file in files:
-            if file.filename:
-                # Save file temporarily and process
-                import tempfile
-                import os
-                
-                with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-                    content = await file.read()
-                    tmp_file.write(content)
-                    tmp_file_path = tmp_file.name
-                
-                # Process file content
-                file_result = await llm_service.process_file(
-                    tmp_file_path,
-                    file.filename,
-                    file.content_type
+        # Temp files are removed when this block exits, unless ownership is
+        # handed to the response below, which removes them once it is sent
+        async with AsyncExitStack() as stack:
+            llm_service = request.app.state.llm_service
+            mcp_client = request.app.state.mcp_client
+            
+            # Process file uploads concurrently; gather preserves upload order
+            semaphore = asyncio.Semaphore(_MAX_CONCURRENT_UPLOADS)
+            
+            async def _guarded(file: UploadFile) -> str:
+                async with semaphore:
+                    return await _process_upload(llm_service, file, stack)
+            
+            # The extracted contents are inlined into the message below
+            file_contents = await asyncio.gather(*(_guarded(f) for f in files if f.filename))
+            
+            # Prepare full message with file contents in a single join
+            parts = [message]
+            if file_contents:
+                parts.append("\n\nAttached files:\n")
+                parts.append("\n\n".join(file_contents))
+            full_message = "".join(parts)
+            
+            # Get tools description
+            tools_description = await mcp_client.get_tools_description()
+            
+            # System prompts
+            system_prompt = _SYSTEM_PROMPT
+            tools_prompt = _TOOLS_PROMPT
+            
+            is_streaming = streaming.lower() == "true"
+            
+            if is_streaming:
+                # The stream outlives this handler; clean up after it finishes
+                # or the client disconnects
+                cleanup = stack.pop_all()
+                return EventSourceResponse(
+                    _stream_chat_completion(
+                        llm_service=llm_service,
+                        mcp_client=mcp_client,
+                        session_id=session_id,
+                        message=full_message,
+                        model=model,
+                        system_prompt=system_prompt,
+                        tools_prompt=tools_prompt,
+                        tools_description=tools_description,
+                        temperature=0.1
+                    ),
+                    ping=_SSE_PING_INTERVAL,
+                    background=BackgroundTask(cleanup.aclose)
                 )
-                
-                file_contents.append(file_result.get("content", f"[File: {file.filename}]"))
-                file_attachments.append({
-                    "id": os.path.basename(tmp_file_path),
-                    "name": file.filename,
-                    "content_type": file.content_type,
-                    "file_path": tmp_file_path
-                })
-        
-        # Prepare full message with file contents
-        full_message = message
-        if file_contents:
-            file_text = "\n\n".join(file_contents)
-            full_message += f"\n\nAttached files:\n{file_text}"
-        
-        # Get tools description
-        tools_description = await mcp_client.get_tools_description()
-        
-        # Read system prompts
-        system_prompt = "You are a helpful AI assistant with access to various tools."
-        tools_prompt = "Use the available tools to help answer user questions accurately."
-        
-        is_streaming = streaming.lower() == "true"
-        
-        if is_streaming:
-            return StreamingResponse(
-                _stream_chat_completion(
-                    llm_service=llm_service,
-                    mcp_client=mcp_client,
+            else:
+                # Non-streaming response
+                response = await llm_service.chat_completion(
+                    model=model,
                     session_id=session_id,
-                    message=full_message,
+                    persist=True,
+                    messages=[litellm.Message(role="user", content=full_message)],
                     system_prompt=system_prompt,
                     tools_prompt=tools_prompt,
-                    tools_description=tools_description,
-                    temperature=0.1
-                ),
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no"
-                }
-            )
-        else:
-            # Non-streaming response
-            response = await llm_service.chat_completion(
-                session_id=session_id,
-                persist=True,
-                messages=[litellm.Message(role="user", content=full_message)],
-                system_prompt=system_prompt,
-                tools_prompt=tools_prompt,
-                attachments=file_attachments,
-                tools=tools_description,
-                tool_manager=mcp_client,
-                temperature=0.1,
-                stream=False
-            )
-            
-            content = response.get("final_response", response.get("response", ""))
-            
-            return {"content": content}
+                    tools=tools_description,
+                    tool_manager=mcp_client,
+                    temperature=0.1,
+                    stream=False
+                )
+                
+                content = response.get("final_response", response.get("response", ""))
+                
+                cleanup = stack.pop_all()
+                return ORJSONResponse(
+                    {"content": content},
+                    background=BackgroundTask(cleanup.aclose)
+                )
             
     except Exception as e:
         logger.error(f"Error in send message: {e}")
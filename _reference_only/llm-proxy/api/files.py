@@ -4,19 +4,60 @@ File processing API endpoints for LLM Proxy Service
 Handles file uploads, transcription, and processing.
 """
 
+import asyncio
 import logging
 import os
-import tempfile
+import shutil
 import uuid
 from typing import List
 
+import aiofiles.tempfile
 from fastapi import APIRouter, HTTPException, Request, File, UploadFile
 from pydantic import BaseModel
 
+from config import LLMProxyConfig
+from mcp_tools.tools.whatsapp.audio import convert_to_opus_ogg_temp
+
 logger = logging.getLogger(__name__)
 
 files_router = APIRouter()
 
+# Upload chunk size; only this much of an upload is held in memory at once
+UPLOAD_CHUNK_SIZE = 1 << 16
+
+
+def temp_dir_for(upload: UploadFile) -> str:
+    """Pick the scratch directory for an upload.
+    
+    tmpfs is used only when the upload's size is known, is at most
+    ``TMPFS_UPLOAD_LIMIT`` and fits in the space tmpfs has left; anything else
+    goes to the disk-backed directory so a large or unsized upload can't fill
+    /dev/shm and fail with ENOSPC.
+    """
+    size = upload.size
+    if size is None or size > LLMProxyConfig.TMPFS_UPLOAD_LIMIT:
+        return LLMProxyConfig.DISK_TEMP_DIR
+    try:
+        free = shutil.disk_usage(LLMProxyConfig.TEMP_DIR).free
+    except OSError:
+        return LLMProxyConfig.DISK_TEMP_DIR
+    # Leave room for other uploads being spooled at the same time
+    if free < 2 * size:
+        return LLMProxyConfig.DISK_TEMP_DIR
+    return LLMProxyConfig.TEMP_DIR
+
+
+async def spool_upload(upload: UploadFile, tmp_file) -> None:
+    """Copy an uploaded file into an open aiofiles temp file in fixed-size chunks.
+    
+    Writes go through aiofiles' thread pool so disk IO never blocks the event loop.
+    """
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        await tmp_file.write(chunk)
+
 
 class TranscriptionResponse(BaseModel):
     """Response model for audio transcription."""
@@ -27,6 +68,24 @@ class TranscriptionResponse(BaseModel):
     file_path: str
 
 
+def _whisper_transcribe(model, path: str) -> str:
+    """Transcribe an audio file with the shared faster_whisper model."""
+    options = {
+        "beam_size": LLMProxyConfig.WHISPER_BEAM_SIZE,
+        "language": "en",  # Force English
+    }
+    if LLMProxyConfig.WHISPER_BATCH_SIZE > 1:
+        # BatchedInferencePipeline decodes audio chunks in parallel batches
+        options["batch_size"] = LLMProxyConfig.WHISPER_BATCH_SIZE
+    else:
+        options["condition_on_previous_text"] = False
+    
+    segments, info = model.transcribe(path, **options)
+    
+    # Combine segments
+    return "".join(segment.text for segment in segments)
+
+
 @files_router.post("/transcribe", response_model=TranscriptionResponse)
 async def transcribe_audio(request: Request, audio: UploadFile = File(...)):
     """Transcribe an audio file to text."""
@@ -40,24 +99,17 @@ async def transcribe_audio(request: Request, audio: UploadFile = File(...)):
         file_id = str(uuid.uuid4())
         filename = f"{file_id}_{audio.filename}"
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(audio.filename)[1]) as tmp_file:
-            content = await audio.read()
-            tmp_file.write(content)
+        async with aiofiles.tempfile.NamedTemporaryFile(
+            "wb",
+            delete=False,
+            suffix=os.path.splitext(audio.filename)[1],
+            dir=temp_dir_for(audio)
+        ) as tmp_file:
+            await spool_upload(audio, tmp_file)
             file_path = tmp_file.name
         
         # Convert audio to Opus format for better processing
         try:
-            # Import audio conversion function
-            import sys
-            from pathlib import Path
-            
-            # Add parent directory to path for imports
-            current_dir = Path(__file__).parent
-            project_root = current_dir.parent.parent.parent
-            sys.path.insert(0, str(project_root))
-            
-            from mcp_tools.tools.whatsapp.audio import convert_to_opus_ogg_temp
-            
             converted_path = convert_to_opus_ogg_temp(file_path)
             logger.info(f"Converted audio file to {converted_path}")
         except Exception as e:
@@ -66,29 +118,17 @@ async def transcribe_audio(request: Request, audio: UploadFile = File(...)):
         
         # Transcribe the audio
         try:
-            # Try faster_whisper first (preferred method)
-            try:
-                from faster_whisper import WhisperModel
-                
+            # Prefer the faster_whisper model loaded once at startup
+            model = getattr(request.app.state, "whisper", None)
+            if model is not None:
                 logger.info("Using local faster_whisper model for transcription")
-                model = WhisperModel(
-                    "medium", device="cuda", compute_type="float32"
-                )
-                
-                # Transcribe with optimized settings
-                segments, info = model.transcribe(
-                    converted_path,
-                    beam_size=10,
-                    language="en",  # Force English
-                    condition_on_previous_text=False,
-                )
                 
-                # Combine segments
-                text = "".join(segment.text for segment in segments)
+                # Decoding runs on the GPU; keep it off the event loop
+                text = await asyncio.to_thread(_whisper_transcribe, model, converted_path)
                 
                 logger.info(f"Transcribed audio using faster_whisper: {text[:50]}...")
                 
-            except ImportError:
+            else:
                 # Fallback to speech_recognition
                 try:
                     import speech_recognition as sr
@@ -141,14 +181,16 @@ async def process_file(request: Request, file: UploadFile = File(...)):
         
         logger.info(f"Processing file: {file.filename}, type: {file.content_type}")
         
+        llm_service = request.app.state.llm_service
+        
         # Save file temporarily
-        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
+        async with aiofiles.tempfile.NamedTemporaryFile(
+            "wb", delete=False, dir=temp_dir_for(file)
+        ) as tmp_file:
+            await spool_upload(file, tmp_file)
             file_path = tmp_file.name
         
         # Process file using LLM service
-        llm_service = request.app.state.llm_service
         result = await llm_service.process_file(
             file_path,
             file.filename,
@@ -4,16 +4,32 @@ Model management API endpoints for LLM Proxy Service
 Handles model listing and capability checks.
 """
 
+import asyncio
 import logging
-from typing import List, Optional
+import re
+import time
+from typing import List, Optional, Tuple
 
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
+from mcp_tools.shared.multi_llm_service import get_available_models
+
 logger = logging.getLogger(__name__)
 
 models_router = APIRouter()
 
+# Model name fragments that indicate reasoning support
+_REASONING_RE = re.compile(r"(?:o1|reasoning|think|chain|cot)", re.IGNORECASE)
+
+# Providers queried when listing models without an explicit provider
+_PROVIDERS = ["openai", "anthropic", "ollama", "lm_studio"]
+
+# Combined model list across all providers as (expiry on the monotonic clock, model ids)
+_ALL_MODELS_TTL = 60.0
+_all_models_cache: Optional[Tuple[float, List[str]]] = None
+
 
 class ModelInfo(BaseModel):
     """Model information."""
@@ -28,37 +44,42 @@ class ModelListResponse(BaseModel):
     models: List[ModelInfo]
 
 
-@models_router.get("", response_model=ModelListResponse)
-async def get_models(request: Request, provider: Optional[str] = None):
+async def _get_all_model_ids() -> List[str]:
+    """Query all providers concurrently, reusing the combined list for a short TTL."""
+    global _all_models_cache
+    
+    cached = _all_models_cache
+    if cached is not None and time.monotonic() < cached[0]:
+        return cached[1]
+    
+    results = await asyncio.gather(
+        *(get_available_models(prov) for prov in _PROVIDERS),
+        return_exceptions=True
+    )
+    
+    model_ids = []
+    for prov, prov_models in zip(_PROVIDERS, results):
+        if isinstance(prov_models, Exception):
+            logger.warning(f"Could not get models from {prov}: {prov_models}")
+            continue
+        # Add provider prefix to distinguish models
+        model_ids.extend([f"{prov}:{model}" for model in prov_models])
+    
+    _all_models_cache = (time.monotonic() + _ALL_MODELS_TTL, model_ids)
+    return model_ids
+
+
+@models_router.get("")
+async def get_models(request: Request, provider: Optional[str] = None) -> ModelListResponse:
     """Get available models."""
     try:
-        # Import the get_available_models function
-        import sys
-        from pathlib import Path
-        
-        # Add parent directory to path for imports
-        current_dir = Path(__file__).parent
-        project_root = current_dir.parent.parent.parent
-        sys.path.insert(0, str(project_root))
-        
-        from mcp_tools.shared.multi_llm_service import get_available_models
-        
         # Get models from the service
         if provider:
             model_ids = await get_available_models(provider)
             provider_name = provider
         else:
             # Get all models from all providers
-            model_ids = []
-            providers = ["openai", "anthropic", "ollama", "lm_studio"]
-            
-            for prov in providers:
-                try:
-                    prov_models = await get_available_models(prov)
-                    # Add provider prefix to distinguish models
-                    model_ids.extend([f"{prov}:{model}" for model in prov_models])
-                except Exception as e:
-                    logger.warning(f"Could not get models from {prov}: {e}")
+            model_ids = await _get_all_model_ids()
         
         # Convert to model info objects
         models = []
@@ -70,9 +91,7 @@ async def get_models(request: Request, provider: Optional[str] = None):
                 model_name = model_id
             
             # Check if model supports reasoning (based on model name)
-            supports_reasoning = any(keyword in model_name.lower() for keyword in [
-                "o1", "reasoning", "think", "chain", "cot"
-            ])
+            supports_reasoning = bool(_REASONING_RE.search(model_name))
             
             models.append(ModelInfo(
                 id=model_id,
@@ -81,7 +100,7 @@ async def get_models(request: Request, provider: Optional[str] = None):
                 supports_reasoning=supports_reasoning
             ))
         
-        return ModelListResponse(models=models)
+        return ORJSONResponse(ModelListResponse(models=models).model_dump())
         
     except Exception as e:
         logger.error(f"Error getting models: {e}")
@@ -7,7 +7,8 @@ Handles chat session creation, retrieval, updates, and deletion.
 import logging
 from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
@@ -49,14 +50,14 @@ class SessionMessagesResponse(BaseModel):
     messages: List[Dict[str, Any]]
 
 
-@sessions_router.get("", response_model=List[SessionResponse])
-async def get_sessions(request: Request):
+@sessions_router.get("")
+async def get_sessions(request: Request) -> List[SessionResponse]:
     """Get all chat sessions."""
     try:
         message_manager = request.app.state.message_manager
         sessions = await message_manager.get_sessions()
         
-        return [
+        session_responses = [
             SessionResponse(
                 session_id=session["session_id"],
                 name=session["name"],
@@ -68,6 +69,8 @@ async def get_sessions(request: Request):
             for session in sessions
         ]
         
+        return ORJSONResponse([s.model_dump() for s in session_responses])
+        
     except Exception as e:
         logger.error(f"Error getting sessions: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to get sessions: {str(e)}")
@@ -96,12 +99,19 @@ async def create_session(request: CreateSessionRequest, req: Request):
 
 
 @sessions_router.get("/{session_id}", response_model=SessionMessagesResponse)
-async def get_session_messages(session_id: str, request: Request):
-    """Get a session with all its messages."""
+async def get_session_messages(
+    session_id: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0)
+):
+    """Get a session with its messages, optionally paginated with limit/offset."""
     try:
         message_manager = request.app.state.message_manager
         
-        session_data = await message_manager.get_session_messages(session_id)
+        session_data = await message_manager.get_session_messages(
+            session_id, limit=limit, offset=offset
+        )
         
         if not session_data:
             raise HTTPException(status_code=404, detail="Session not found")
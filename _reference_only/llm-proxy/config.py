@@ -5,7 +5,7 @@ Environment-based configuration for LLM providers, database connections, and ser
 """
 
 import os
-from typing import Optional
+from typing import List, Optional
 
 
 class LLMProxyConfig:
@@ -15,14 +15,36 @@ class LLMProxyConfig:
     HOST: str = os.getenv("LLM_PROXY_HOST", "0.0.0.0")
     PORT: int = int(os.getenv("LLM_PROXY_PORT", "11435"))
     DEBUG: bool = os.getenv("DEBUG", "false").lower() == "true"
+    # Each worker process loads its own Whisper and embedding models (Whisper
+    # on the GPU) and keeps its own in-process caches (semantic cache, MCP
+    # circuit breaker and batcher, model lists, response LRU). Raise this only
+    # with enough GPU memory for one Whisper copy per worker, accepting that
+    # caches are no longer shared between requests served by different workers.
+    WORKERS: int = int(os.getenv("LLM_PROXY_WORKERS", "1"))
+    ALLOWED_ORIGINS: List[str] = [
+        origin.strip()
+        for origin in os.getenv(
+            "LLM_PROXY_ALLOWED_ORIGINS", "http://localhost:8080,http://127.0.0.1:8080"
+        ).split(",")
+        if origin.strip()
+    ]
 
     # MCP Service Configuration
     MCP_SERVICE_URL: str = os.getenv("MCP_SERVICE_URL", "http://localhost:8084")
+    MCP_TOOLS_CACHE_TTL: float = float(os.getenv("MCP_TOOLS_CACHE_TTL", "30"))
+    MCP_MAX_CONNECTIONS: int = int(os.getenv("MCP_MAX_CONNECTIONS", "128"))
+    MCP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("MCP_MAX_KEEPALIVE_CONNECTIONS", "64"))
+    MCP_KEEPALIVE_EXPIRY: float = float(os.getenv("MCP_KEEPALIVE_EXPIRY", "30"))
+    MCP_BATCH_WINDOW: float = float(os.getenv("MCP_BATCH_WINDOW", "0.005"))
 
     # Neo4j Configuration (for message persistence)
     NEO4J_URI: str = os.getenv("NEO4J_URI", "bolt://localhost:7687")
     NEO4J_USERNAME: str = os.getenv("NEO4J_USERNAME", "neo4j")
     NEO4J_PASSWORD: str = os.getenv("NEO4J_PASSWORD", "neo4jpwd")
+    # Server-side write transaction timeouts in seconds; 0 uses the server
+    # default. Deleting or truncating a session removes every message in it.
+    NEO4J_WRITE_TIMEOUT: float = float(os.getenv("NEO4J_WRITE_TIMEOUT", "5"))
+    NEO4J_BULK_DELETE_TIMEOUT: float = float(os.getenv("NEO4J_BULK_DELETE_TIMEOUT", "300"))
 
     # LLM Provider API Keys
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
@@ -48,6 +70,15 @@ class LLMProxyConfig:
         int(os.getenv("MAX_FILE_SIZE", "100")) * 1024 * 1024
     )  # 100MB default
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "/tmp/llm-proxy-uploads")
+    # Scratch files live on tmpfs so upload processing stays RAM-resident.
+    # Docker caps /dev/shm at 64MB unless shm_size is raised, so only uploads
+    # of a known size up to TMPFS_UPLOAD_LIMIT that fit in its free space go
+    # there; everything else spills to DISK_TEMP_DIR.
+    TEMP_DIR: str = os.getenv("LLM_PROXY_TEMP_DIR", "/dev/shm/llm-proxy")
+    DISK_TEMP_DIR: str = os.getenv("LLM_PROXY_DISK_TEMP_DIR", "/tmp/llm-proxy")
+    TMPFS_UPLOAD_LIMIT: int = (
+        int(os.getenv("TMPFS_UPLOAD_LIMIT", "16")) * 1024 * 1024
+    )  # 16MB default
 
     # Multi-LLM Service Configuration
     MULTI_LLM_JSON_PARSE_RETRIES: int = int(
@@ -55,10 +86,25 @@ class LLMProxyConfig:
     )
     MULTI_LLM_CACHE_SIZE: int = int(os.getenv("MULTI_LLM_CACHE_SIZE", "1000"))
 
+    # Semantic Response Cache Configuration
+    # Off by default: enabling it loads an embedding model at startup
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_MODEL: str = os.getenv(
+        "SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+    )
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    SEMANTIC_CACHE_SIZE: int = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+    SEMANTIC_CACHE_TTL: float = float(os.getenv("SEMANTIC_CACHE_TTL", "300"))
+    SEMANTIC_CACHE_MAX_CONTEXTS: int = int(os.getenv("SEMANTIC_CACHE_MAX_CONTEXTS", "1000"))
+    # Number of a session's newest messages that scope its cached responses
+    SEMANTIC_CACHE_HISTORY: int = int(os.getenv("SEMANTIC_CACHE_HISTORY", "4"))
+
     # Audio Transcription Configuration
     WHISPER_MODEL: str = os.getenv("WHISPER_MODEL", "medium")
     WHISPER_DEVICE: str = os.getenv("WHISPER_DEVICE", "cuda")
-    WHISPER_COMPUTE_TYPE: str = os.getenv("WHISPER_COMPUTE_TYPE", "float32")
+    WHISPER_COMPUTE_TYPE: str = os.getenv("WHISPER_COMPUTE_TYPE", "int8_float16")
+    WHISPER_BEAM_SIZE: int = int(os.getenv("WHISPER_BEAM_SIZE", "5"))
+    WHISPER_BATCH_SIZE: int = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
 
     @classmethod
     def get_neo4j_config(cls) -> dict:
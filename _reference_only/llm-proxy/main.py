@@ -9,11 +9,12 @@ import asyncio
 import logging
 import os
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 import uvicorn
 
 # Add the current directory to the path so we can import from mcp_server
@@ -27,6 +28,7 @@ from api.models import models_router
 from services.multi_llm_service import MultiLLMService
 from services.message_manager import MessageManager
 from services.mcp_client import MCPClient
+from services.semantic_cache import SemanticCache
 from config import LLMProxyConfig
 
 # Configure logging
@@ -37,71 +39,134 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Create FastAPI app
-app = FastAPI(
-    title="LLM Proxy Service",
-    description="LLM interactions, chat sessions, and tool orchestration",
-    version="1.0.0"
-)
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Configure appropriately for production
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Global service instances
 llm_service: MultiLLMService = None
 message_manager: MessageManager = None
 mcp_client: MCPClient = None
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup."""
+def _create_semantic_cache():
+    """Build the semantic cache, or None when disabled in configuration."""
+    if not LLMProxyConfig.SEMANTIC_CACHE_ENABLED:
+        return None
+    return SemanticCache(
+        model_name=LLMProxyConfig.SEMANTIC_CACHE_MODEL,
+        threshold=LLMProxyConfig.SEMANTIC_CACHE_THRESHOLD,
+        max_entries=LLMProxyConfig.SEMANTIC_CACHE_SIZE,
+        ttl=LLMProxyConfig.SEMANTIC_CACHE_TTL,
+        max_contexts=LLMProxyConfig.SEMANTIC_CACHE_MAX_CONTEXTS,
+        history_size=LLMProxyConfig.SEMANTIC_CACHE_HISTORY
+    )
+
+
+def _load_whisper_model():
+    """Load the faster_whisper model once, or None if it is unavailable."""
+    try:
+        from faster_whisper import BatchedInferencePipeline, WhisperModel
+        
+        model = WhisperModel(
+            LLMProxyConfig.WHISPER_MODEL,
+            device=LLMProxyConfig.WHISPER_DEVICE,
+            compute_type=LLMProxyConfig.WHISPER_COMPUTE_TYPE
+        )
+        if LLMProxyConfig.WHISPER_BATCH_SIZE > 1:
+            return BatchedInferencePipeline(model=model)
+        return model
+    except Exception as e:
+        logger.warning(f"faster_whisper unavailable, transcription will use fallbacks: {e}")
+        return None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize services on startup and clean them up on shutdown."""
     global llm_service, message_manager, mcp_client
     
     logger.info("Starting LLM Proxy Service...")
     
-    # Initialize Neo4j connection for message persistence
-    from neo4j import GraphDatabase
+    os.makedirs(LLMProxyConfig.TEMP_DIR, exist_ok=True)
+    os.makedirs(LLMProxyConfig.DISK_TEMP_DIR, exist_ok=True)
+    
+    from neo4j import AsyncGraphDatabase
     neo4j_config = LLMProxyConfig.get_neo4j_config()
-    neo4j_driver = GraphDatabase.driver(
+    
+    # Async driver so database round trips never block the event loop
+    neo4j_driver = AsyncGraphDatabase.driver(
         neo4j_config["uri"],
         auth=(neo4j_config["username"], neo4j_config["password"])
     )
     
+    # One pooled HTTP/2 client shared by every chat request
+    mcp_client = MCPClient(
+        LLMProxyConfig.MCP_SERVICE_URL,
+        tools_cache_ttl=LLMProxyConfig.MCP_TOOLS_CACHE_TTL,
+        max_connections=LLMProxyConfig.MCP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLMProxyConfig.MCP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLMProxyConfig.MCP_KEEPALIVE_EXPIRY,
+        batch_window=LLMProxyConfig.MCP_BATCH_WINDOW
+    )
+    
+    # Independent start-up work runs concurrently: the embedding and Whisper
+    # model loads, and connecting to the MCP service (which also pre-warms
+    # its tools cache)
+    semantic_cache, whisper_model, _ = await asyncio.gather(
+        asyncio.to_thread(_create_semantic_cache),
+        asyncio.to_thread(_load_whisper_model),
+        mcp_client.connect()
+    )
+    
     # Initialize services
-    message_manager = MessageManager(neo4j_driver)
+    message_manager = MessageManager(
+        neo4j_driver,
+        write_timeout=LLMProxyConfig.NEO4J_WRITE_TIMEOUT,
+        bulk_delete_timeout=LLMProxyConfig.NEO4J_BULK_DELETE_TIMEOUT
+    )
+    await message_manager.ensure_schema()
     llm_service = MultiLLMService(neo4j_driver=neo4j_driver)
-    mcp_client = MCPClient(LLMProxyConfig.MCP_SERVICE_URL)
     
     # Store in app state for access in routes
     app.state.llm_service = llm_service
     app.state.message_manager = message_manager
     app.state.mcp_client = mcp_client
+    app.state.semantic_cache = semantic_cache
+    app.state.whisper = whisper_model
     
     logger.info("LLM Proxy Service initialized successfully")
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Clean up services on shutdown."""
-    global llm_service, message_manager, mcp_client
+    
+    yield
     
     logger.info("Shutting down LLM Proxy Service...")
     
-    if llm_service:
-        await llm_service.close()
-    if mcp_client:
-        await mcp_client.close()
+    await asyncio.gather(
+        llm_service.close(),
+        mcp_client.close(),
+        neo4j_driver.close()
+    )
     
     logger.info("LLM Proxy Service shutdown complete")
 
 
+# Create FastAPI app
+app = FastAPI(
+    title="LLM Proxy Service",
+    description="LLM interactions, chat sessions, and tool orchestration",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
+
+# Configure CORS; browsers cache preflight responses for max_age seconds
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=LLMProxyConfig.ALLOWED_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["X-Accel-Buffering"],
+    max_age=86400,
+)
+
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -129,7 +194,13 @@ def main():
         host=config.HOST,
         port=config.PORT,
         reload=config.DEBUG,
-        log_level="info"
+        log_level="info",
+        loop="uvloop",
+        http="httptools",
+        # Reload mode only supports a single worker
+        workers=1 if config.DEBUG else config.WORKERS,
+        backlog=2048,
+        timeout_keep_alive=30
     )
 
 
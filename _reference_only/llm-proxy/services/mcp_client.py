@@ -5,27 +5,152 @@ HTTP client for communicating with the MCP Tools service.
 """
 
 import asyncio
-import json
 import logging
-from typing import Any, Dict, List, Optional
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import httpx
+import orjson
 
 logger = logging.getLogger(__name__)
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Result returned without a request while the MCP service is unavailable
+_UNAVAILABLE_ERROR = "MCP service unavailable"
+_UNAVAILABLE_RESULT = orjson.dumps({"error": _UNAVAILABLE_ERROR})
+
+# Error templates, shared by the log call and the returned error payload
+_EXECUTE_FAILED = "Tool execution failed: %s"
+_EXECUTE_ERROR = "Error executing tool %s: %s"
+_BATCH_FAILED = "Tool batch execution failed: %s"
+_BATCH_ERROR = "Error executing tool batch: %s"
+_BATCH_MISMATCH = "Tool batch returned %d results for %d calls"
+
+
+@dataclass(slots=True, frozen=True)
+class ToolInfo:
+    """A tool advertised by the MCP service."""
+    name: str
+    description: str
+    raw: Dict[str, Any]
+
+
+class BatchingExecutor:
+    """Coalesce concurrent tool calls into a single batch request.
+    
+    The first call in a window schedules a flush; calls arriving within
+    ``window`` seconds join it and each caller receives its own JSON-encoded
+    result.
+    """
+    
+    def __init__(
+        self,
+        execute_batch: Callable[[List[Tuple[str, Dict[str, Any]]]], Awaitable[List[bytes]]],
+        window: float = 0.005
+    ):
+        """Initialize the executor.
+        
+        Args:
+            execute_batch: Coroutine executing a list of (tool, arguments) calls
+                and returning one JSON-encoded result per call
+            window: Seconds to wait for more calls before flushing a batch
+        """
+        self._execute_batch = execute_batch
+        self.window = window
+        self._pending: List[Tuple[str, Dict[str, Any], asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+    
+    async def submit(self, tool_name: str, arguments: Dict[str, Any]) -> bytes:
+        """Queue a tool call for the next batch and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((tool_name, arguments, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+        return await future
+    
+    async def _flush(self):
+        """Execute every call queued during the batching window."""
+        await asyncio.sleep(self.window)
+        pending, self._pending = self._pending, []
+        self._flush_task = None
+        
+        try:
+            results = await self._execute_batch([(tool, args) for tool, args, _ in pending])
+        except Exception as e:
+            results = [orjson.dumps({"error": _BATCH_ERROR % e})] * len(pending)
+        
+        for (_, _, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
 
 class MCPClient:
     """HTTP client for MCP Tools service."""
     
-    def __init__(self, base_url: str):
+    def __init__(
+        self,
+        base_url: str,
+        tools_cache_ttl: float = 30.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        batch_window: float = 0.005,
+        prefetch_tools: bool = True,
+        failure_threshold: int = 5,
+        circuit_open_seconds: float = 10.0
+    ):
         """Initialize MCP client.
         
         Args:
             base_url: Base URL of the MCP Tools service (e.g., http://localhost:8084)
+            tools_cache_ttl: Seconds to reuse the formatted tools description
+            max_connections: Maximum concurrent connections to the MCP service
+            max_keepalive_connections: Idle connections kept open for reuse
+            keepalive_expiry: Seconds an idle connection stays in the pool
+            batch_window: Seconds to coalesce concurrent tool calls into one
+                /execute_batch request; 0 disables batching
+            prefetch_tools: Fetch the tool catalog alongside the health check
+                in ``connect``
+            failure_threshold: Consecutive failures that open the circuit breaker
+            circuit_open_seconds: Seconds calls fail fast once the circuit opens
         """
         self.base_url = base_url.rstrip("/")
         self.client: Optional[httpx.AsyncClient] = None
         self._connected = False
+        
+        # Connection pool sized to the expected tool-call concurrency
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        
+        # Cached tool catalog and its expiry on the monotonic clock
+        self.tools_cache_ttl = tools_cache_ttl
+        self._tools_cache: Optional[Tuple[ToolInfo, ...]] = None
+        self._tools_cache_expiry: float = 0.0
+        self._tools_lock = asyncio.Lock()
+        self.prefetch_tools = prefetch_tools
+        
+        # Prompt description formatted once per catalog refresh
+        self._tools_description: Optional[str] = None
+        
+        # Pre-serialized /execute payload prefixes keyed by tool name
+        self._tool_prefix_cache: Dict[str, bytes] = {}
+        
+        # Concurrent tool calls are batched until the service lacks /execute_batch
+        self._batch_supported: Optional[bool] = None
+        self._batcher: Optional[BatchingExecutor] = None
+        if batch_window > 0:
+            self._batcher = BatchingExecutor(self._execute_batch_raw, batch_window)
+        
+        # Circuit breaker: after repeated failures calls fail fast until a
+        # background health check finds the service up again
+        self.failure_threshold = failure_threshold
+        self.circuit_open_seconds = circuit_open_seconds
+        self._failure_count = 0
+        self._circuit_open_until: float = 0.0
+        self._recovery_task: Optional[asyncio.Task] = None
     
     async def __aenter__(self):
         """Async context manager entry."""
@@ -37,27 +162,62 @@ class MCPClient:
         await self.close()
     
     async def connect(self):
-        """Connect to the MCP service."""
+        """Connect to the MCP service.
+        
+        Call once at service startup; the client is then shared by every
+        request. Calling again while connected is a no-op.
+        """
+        if self._connected:
+            return
+        
         if not self.client:
+            # HTTP/2 multiplexes concurrent /execute calls over one connection
             self.client = httpx.AsyncClient(
                 base_url=self.base_url,
-                timeout=httpx.Timeout(30.0)
+                http2=True,
+                # Fail fast when the pool is exhausted instead of queueing
+                timeout=httpx.Timeout(connect=1.0, read=30.0, write=30.0, pool=1.0),
+                transport=httpx.AsyncHTTPTransport(
+                    http2=True,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive_connections,
+                        keepalive_expiry=self.keepalive_expiry
+                    ),
+                    # Transparently re-establish dropped connections; httpx only
+                    # retries failed connects, so requests are never sent twice
+                    retries=2
+                )
             )
         
-        # Test connection
-        try:
-            response = await self.client.get("/health")
-            if response.status_code == 200:
-                self._connected = True
-                logger.info(f"Connected to MCP service at {self.base_url}")
-            else:
-                logger.warning(f"MCP service health check failed: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Failed to connect to MCP service: {e}")
+        # Test connection and fetch the tool catalog concurrently
+        requests = [self.client.get("/health")]
+        if self.prefetch_tools:
+            # Only the health check feeds the circuit breaker
+            requests.append(self._fetch_tools(track_failures=False))
+        response, *prefetched = await asyncio.gather(*requests, return_exceptions=True)
+        
+        if isinstance(response, Exception):
+            logger.error("Failed to connect to MCP service: %s", response)
             self._connected = False
+            self._record_error(response)
+        elif response.status_code == 200:
+            self._connected = True
+            self._failure_count = 0
+            self._circuit_open_until = 0.0
+            logger.info("Connected to MCP service at %s", self.base_url)
+        else:
+            logger.warning("MCP service health check failed: %s", response.status_code)
+            self._record_response(response)
+        
+        if prefetched and isinstance(prefetched[0], list):
+            self._store_tools(prefetched[0])
     
     async def close(self):
         """Close the HTTP client."""
+        if self._recovery_task is not None:
+            self._recovery_task.cancel()
+            self._recovery_task = None
         if self.client:
             await self.client.aclose()
             self.client = None
@@ -67,31 +227,78 @@ class MCPClient:
         """Check if connected to MCP service."""
         return self._connected
     
-    async def list_tools(self) -> List[Dict[str, Any]]:
+    async def list_tools(self) -> Tuple[ToolInfo, ...]:
         """List available tools from MCP service.
         
+        The catalog is cached for ``tools_cache_ttl`` seconds; failed fetches
+        are not cached so the next call retries. The returned tuple is shared
+        with the cache, so it is immutable.
+        
         Returns:
-            List of tool definitions
+            Tuple of tool definitions
         """
+        tools = self._tools_cache
+        if tools is not None and time.monotonic() < self._tools_cache_expiry:
+            return tools
+        
+        async with self._tools_lock:
+            # Another request may have refreshed the cache while we waited
+            tools = self._tools_cache
+            if tools is not None and time.monotonic() < self._tools_cache_expiry:
+                return tools
+            
+            if not await self._ensure_available():
+                return ()
+            
+            raw_tools = await self._fetch_tools()
+            if raw_tools is None:
+                return ()
+            
+            return self._store_tools(raw_tools)
+    
+    def _store_tools(self, raw_tools: List[Dict[str, Any]]) -> Tuple[ToolInfo, ...]:
+        """Cache a freshly fetched tool catalog and its prompt description."""
+        tools = tuple(
+            ToolInfo(
+                name=tool.get("name", "Unknown"),
+                description=tool.get("description", "No description"),
+                raw=tool
+            )
+            for tool in raw_tools
+        )
+        self._tools_cache = tools
+        self._tools_description = self._format_tools_description(tools)
+        self._tools_cache_expiry = time.monotonic() + self.tools_cache_ttl
+        return tools
+    
+    async def _fetch_tools(self, track_failures: bool = True) -> Optional[List[Dict[str, Any]]]:
+        """Fetch the tool catalog from the MCP service, or None on failure."""
         if not self.client:
-            await self.connect()
+            raise RuntimeError("MCPClient not connected")
         
         try:
             # For now, we'll use the SSE endpoint to get tools
             # In the future, we should add a proper REST endpoint for tool listing
             response = await self.client.get("/tools")
+            if track_failures:
+                self._record_response(response)
             if response.status_code == 200:
-                return response.json()
+                return orjson.loads(response.content)
             else:
-                logger.error(f"Failed to list tools: {response.status_code}")
-                return []
+                logger.error("Failed to list tools: %s", response.status_code)
+                return None
         except Exception as e:
-            logger.error(f"Error listing tools: {e}")
-            return []
+            logger.error("Error listing tools: %s", e)
+            if track_failures:
+                self._record_error(e)
+            return None
     
     async def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
         """Execute a tool via the MCP service.
         
+        Calls made concurrently are coalesced into one /execute_batch request
+        while the service supports it.
+        
         Args:
             tool_name: Name of the tool to execute
             arguments: Tool arguments
@@ -99,43 +306,198 @@ class MCPClient:
         Returns:
             Tool execution result
         """
-        if not self.client:
-            await self.connect()
+        return orjson.loads(await self.execute_tool_raw(tool_name, arguments))
+    
+    async def execute_tools_batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        """Execute several tools in a single request to the MCP service.
+        
+        Falls back to individual /execute calls if the service has no
+        /execute_batch endpoint; the capability probe is remembered.
+        
+        Args:
+            calls: List of (tool name, arguments) pairs
+            
+        Returns:
+            Tool execution results in the same order as ``calls``
+        """
+        if len(calls) <= 1 or self._batch_supported is False:
+            return [orjson.loads(raw) for raw in await self._execute_each_raw(calls)]
+        
+        if not await self._ensure_available():
+            return [{"error": _UNAVAILABLE_ERROR} for _ in calls]
         
         try:
-            # For now, we'll need to use the SSE interface
-            # In the future, we should add proper REST endpoints for tool execution
             payload = {
-                "tool": tool_name,
-                "arguments": arguments
+                "calls": [{"tool": tool_name, "arguments": arguments} for tool_name, arguments in calls]
             }
             
-            response = await self.client.post("/execute", json=payload)
+            response = await self._post_json("/execute_batch", payload)
+            self._record_response(response)
+            if response.status_code == 404:
+                logger.info("MCP service has no /execute_batch endpoint, executing tools individually")
+                self._batch_supported = False
+                return await self.execute_tools_batch(calls)
+            elif response.status_code == 200:
+                self._batch_supported = True
+                results = orjson.loads(response.content)
+                if isinstance(results, dict):
+                    results = results.get("results", [])
+                if len(results) == len(calls):
+                    return results
+                template, args = _BATCH_MISMATCH, (len(results), len(calls))
+            else:
+                template, args = _BATCH_FAILED, (response.status_code,)
+        except Exception as e:
+            template, args = _BATCH_ERROR, (e,)
+            self._record_error(e)
+        
+        logger.error(template, *args)
+        error = {"error": template % args}
+        return [error] * len(calls)
+    
+    async def execute_tool_raw(self, tool_name: str, arguments: Dict[str, Any]) -> bytes:
+        """Execute a tool and return the undecoded JSON response body.
+        
+        Callers that only forward the result (to the LLM or an SSE stream)
+        use this to skip a parse and re-serialize round trip. Like
+        ``execute_tool``, concurrent calls are coalesced into one
+        /execute_batch request while the service supports it. Errors are
+        returned as an encoded ``{"error": ...}`` object.
+        
+        Args:
+            tool_name: Name of the tool to execute
+            arguments: Tool arguments
+            
+        Returns:
+            JSON-encoded tool execution result
+        """
+        if self._batcher is not None and self._batch_supported is not False:
+            return await self._batcher.submit(tool_name, arguments)
+        return await self._execute_single_raw(tool_name, arguments)
+    
+    async def _execute_batch_raw(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[bytes]:
+        """Execute a batch of tools, returning each result JSON-encoded.
+        
+        A lone call goes straight to /execute so its response body is passed
+        through without being decoded.
+        """
+        if len(calls) <= 1 or self._batch_supported is False:
+            return await self._execute_each_raw(calls)
+        return [orjson.dumps(result) for result in await self.execute_tools_batch(calls)]
+    
+    async def _execute_each_raw(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[bytes]:
+        """Execute tools concurrently with one /execute request each."""
+        return list(await asyncio.gather(*(self._execute_single_raw(t, a) for t, a in calls)))
+    
+    async def _execute_single_raw(self, tool_name: str, arguments: Dict[str, Any]) -> bytes:
+        """Execute one tool via the /execute endpoint, returning the raw body."""
+        if not await self._ensure_available():
+            return _UNAVAILABLE_RESULT
+        
+        try:
+            # For now, we'll need to use the SSE interface
+            # In the future, we should add proper REST endpoints for tool execution
+            # Only the arguments are encoded per call; the {"tool": ...} envelope
+            # is serialized once per tool name
+            prefix = self._tool_prefix_cache.get(tool_name)
+            if prefix is None:
+                # b'{"tool":"<name>","arguments":{}}' minus the trailing b'{}}'
+                prefix = orjson.dumps({"tool": tool_name, "arguments": {}})[:-3]
+                self._tool_prefix_cache[tool_name] = prefix
+            body = prefix + orjson.dumps(arguments) + b"}"
+            
+            response = await self.client.post("/execute", content=body, headers=_JSON_HEADERS)
+            self._record_response(response)
             if response.status_code == 200:
-                return response.json()
+                return response.content
             else:
-                error_msg = f"Tool execution failed: {response.status_code}"
-                logger.error(error_msg)
-                return {"error": error_msg}
+                logger.error(_EXECUTE_FAILED, response.status_code)
+                return orjson.dumps({"error": _EXECUTE_FAILED % response.status_code})
         except Exception as e:
-            error_msg = f"Error executing tool {tool_name}: {e}"
-            logger.error(error_msg)
-            return {"error": error_msg}
+            logger.error(_EXECUTE_ERROR, tool_name, e)
+            self._record_error(e)
+            return orjson.dumps({"error": _EXECUTE_ERROR % (tool_name, e)})
+    
+    async def _ensure_available(self) -> bool:
+        """Return False at once while the MCP service is known to be down.
+        
+        Without this, every call during an outage would wait out the request
+        timeout while holding a connection pool slot.
+        """
+        if time.monotonic() < self._circuit_open_until:
+            return False
+        if not self._connected:
+            await self.connect()
+        return self._connected
+    
+    def _record_response(self, response: httpx.Response):
+        """Track a response: 5xx counts as a failure, anything else resets the count."""
+        if response.status_code >= 500:
+            self._record_failure()
+        else:
+            self._failure_count = 0
+    
+    def _record_error(self, error: BaseException):
+        """Count an exception only if it means the service is unreachable.
+        
+        A slow tool hitting the read timeout, an exhausted local pool or an
+        unserializable argument says nothing about the service's health.
+        """
+        if isinstance(error, httpx.TransportError) and not isinstance(
+            error, (httpx.ReadTimeout, httpx.PoolTimeout)
+        ):
+            self._record_failure()
+    
+    def _record_failure(self):
+        """Count a consecutive failure and open the circuit at the threshold."""
+        self._failure_count += 1
+        if self._failure_count < self.failure_threshold:
+            return
+        
+        self._connected = False
+        self._circuit_open_until = time.monotonic() + self.circuit_open_seconds
+        if self._recovery_task is None or self._recovery_task.done():
+            logger.warning(
+                "MCP service failed %d times, failing fast for %ss",
+                self._failure_count,
+                self.circuit_open_seconds
+            )
+            self._recovery_task = asyncio.create_task(self._recover())
+    
+    async def _recover(self):
+        """Health-check the MCP service each time the circuit is due to close."""
+        while not self._connected:
+            await asyncio.sleep(max(self._circuit_open_until - time.monotonic(), 0.0))
+            await self.connect()
+    
+    async def _post_json(self, path: str, payload: Any) -> httpx.Response:
+        """POST a payload serialized with orjson rather than stdlib json."""
+        return await self.client.post(path, content=orjson.dumps(payload), headers=_JSON_HEADERS)
     
     async def get_tools_description(self) -> str:
         """Get a formatted description of all available tools.
         
+        The description is formatted when ``list_tools`` refreshes the
+        catalog, so prompt builds within the TTL do no per-tool work.
+        
         Returns:
             Formatted string describing all tools
         """
         tools = await self.list_tools()
         if not tools:
             return "No tools available from MCP service."
-        
-        descriptions = []
-        for tool in tools:
-            name = tool.get("name", "Unknown")
-            description = tool.get("description", "No description")
-            descriptions.append(f"- {name}: {description}")
-        
-        return "Available tools:\n" + "\n".join(descriptions)
\ No newline at end of file
+        return self._tools_description
+    
+    async def invalidate_tools_cache(self):
+        """Drop the cached tool catalog so the next call refetches it."""
+        async with self._tools_lock:
+            self._tools_cache = None
+            self._tools_cache_expiry = 0.0
+            self._tools_description = None
+    
+    @staticmethod
+    def _format_tools_description(tools: Tuple[ToolInfo, ...]) -> str:
+        """Format a tool catalog for prompts."""
+        return "Available tools:\n" + "\n".join(
+            "- %s: %s" % (tool.name, tool.description) for tool in tools
+        )
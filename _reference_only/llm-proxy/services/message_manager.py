@@ -4,27 +4,203 @@ Message Manager - Centralized management of chat messages and sessions
 
 import logging
 import datetime
-import uuid
-from typing import List, Dict, Any, Optional
+import hashlib
+import secrets
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+import orjson
+from neo4j import unit_of_work
 
 logger = logging.getLogger(__name__)
 
+
+# Default server-side timeouts (seconds) for chat write transactions; deleting
+# or truncating a session removes all of its messages, so it gets a longer bound
+_WRITE_TIMEOUT = 5.0
+_BULK_DELETE_TIMEOUT = 300.0
+
+# Uniqueness constraints (which are backed by indexes) and range indexes for
+# every property the chat queries match or sort on
+_SCHEMA_STATEMENTS = (
+    "CREATE CONSTRAINT chat_session_id IF NOT EXISTS FOR (s:ChatSession) REQUIRE s.id IS UNIQUE",
+    "CREATE CONSTRAINT chat_message_id IF NOT EXISTS FOR (m:ChatMessage) REQUIRE m.id IS UNIQUE",
+    "CREATE CONSTRAINT chat_attachment_id IF NOT EXISTS FOR (a:ChatAttachment) REQUIRE a.id IS UNIQUE",
+    "CREATE CONSTRAINT chat_message_dedup_key IF NOT EXISTS FOR (m:ChatMessage) REQUIRE m.dedup_key IS UNIQUE",
+    "CREATE INDEX chat_session_group_id IF NOT EXISTS FOR (s:ChatSession) ON (s.group_id)",
+    "CREATE INDEX chat_message_timestamp IF NOT EXISTS FOR (m:ChatMessage) ON (m.timestamp)",
+)
+
+# Messages of a session in per-session sequence order, with legacy messages
+# without a seq first by timestamp. Paging happens before attachments are
+# fetched; the optional LIMIT clause is substituted for %s.
+_SESSION_MESSAGES_QUERY = """
+    MATCH (:ChatSession {id: $session_id})-[:CONTAINS]->(m:ChatMessage)
+    WITH m
+    ORDER BY coalesce(m.seq, 0), m.timestamp
+    SKIP $offset
+    %s
+    OPTIONAL MATCH (m)-[:HAS_ATTACHMENT]->(a:ChatAttachment)
+    WITH m, collect(a {.id, .name, .content_type, .file_path}) AS attachments
+    ORDER BY coalesce(m.seq, 0), m.timestamp
+    RETURN m, attachments
+"""
+
+# The newest messages of a session, newest first, without their attachments
+_RECENT_MESSAGES_QUERY = """
+    MATCH (:ChatSession {id: $session_id})-[:CONTAINS]->(m:ChatMessage)
+    RETURN m.id AS id, m.role AS role, m.content AS content
+    ORDER BY coalesce(m.seq, 0) DESC, m.timestamp DESC
+    LIMIT $limit
+"""
+
+
+def _flatten_tool_calls(tool_calls: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """
+    Split OpenAI-style tool_calls into parallel string lists.
+
+    Neo4j properties cannot hold maps, but homogeneous lists of strings are
+    stored natively, so tool calls round-trip without a JSON codec.
+    """
+    ids, names, arguments = [], [], []
+    for tool_call in tool_calls:
+        function = tool_call.get("function") or {}
+        args = function.get("arguments", "")
+        ids.append(tool_call.get("id") or "")
+        names.append(function.get("name") or "")
+        arguments.append(args if isinstance(args, str) else orjson.dumps(args).decode())
+    return {"ids": ids, "names": names, "arguments": arguments}
+
+
+def _build_tool_calls(ids: List[str], names: List[str], arguments: List[str]) -> List[Dict[str, Any]]:
+    """Rebuild OpenAI-style tool_calls from the stored parallel lists."""
+    return [
+        {"id": tool_call_id, "type": "function", "function": {"name": name, "arguments": args}}
+        for tool_call_id, name, args in zip(ids, names or [], arguments or [])
+    ]
+
+
+@lru_cache(maxsize=256)
+def _parse_tool_calls(tool_calls_json: str) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Parse legacy tool_calls JSON into immutable (ids, names, arguments) columns.
+
+    Repeated strings (retries, regenerations) hit the cache; callers rebuild
+    fresh dicts with ``_build_tool_calls`` so cached data is never mutated.
+    """
+    flattened = _flatten_tool_calls(orjson.loads(tool_calls_json))
+    return tuple(flattened["ids"]), tuple(flattened["names"]), tuple(flattened["arguments"])
+
+
+def _timestamp() -> str:
+    """
+    Current local time as a fixed-width ISO 8601 string.
+    
+    Always including microseconds keeps the strings the same length, so
+    ordering them lexically (as ORDER BY s.updated_at does) is chronological.
+    """
+    return datetime.datetime.now().isoformat(timespec="microseconds")
+
+
+def _dedup_key(session_id: str, role: str, content: str, idempotency_key: Optional[str] = None) -> str:
+    """
+    Key identifying a message for idempotent inserts.
+    
+    A client-supplied idempotency key replaces the content, so long messages
+    are not hashed; its extra leading part keeps it apart from content keys.
+    """
+    if idempotency_key is not None:
+        parts = ("idempotency", session_id, role, idempotency_key)
+    else:
+        parts = (session_id, role, content)
+    return hashlib.blake2b("\0".join(parts).encode(), digest_size=16).hexdigest()
+
+
+async def _run_single(tx, query: str, params: Dict[str, Any]):
+    """Transaction function running one query and returning its single record."""
+    result = await tx.run(query, params)
+    return await result.single()
+
+
+async def _run_consume(tx, query: str, params: Dict[str, Any]):
+    """Transaction function running one query and returning its result summary."""
+    result = await tx.run(query, params)
+    return await result.consume()
+
+
+@lru_cache(maxsize=None)
+def _write_tx(op: str, single: bool = True, timeout: Optional[float] = _WRITE_TIMEOUT):
+    """
+    Transaction function for the write ``op``.
+    
+    The transaction is bounded by a server-side ``timeout`` (None or 0 leaves
+    the server's default) and tagged with ``op`` in its metadata, so it is
+    identifiable in SHOW TRANSACTIONS and the query log. ``single`` selects
+    returning the single record over the summary.
+    """
+    tx_function = _run_single if single else _run_consume
+    return unit_of_work(metadata={"op": op}, timeout=timeout or None)(tx_function)
+
+
 class MessageManager:
     """
     Centralized manager for chat messages and sessions.
     Handles all persistence operations for chat functionality.
     """
     
-    def __init__(self, neo4j_driver):
+    # Set once the schema statements have run in this process
+    _schema_ready = False
+    
+    def __init__(
+        self,
+        neo4j_driver,
+        write_timeout: Optional[float] = _WRITE_TIMEOUT,
+        bulk_delete_timeout: Optional[float] = _BULK_DELETE_TIMEOUT,
+    ):
         """
         Initialize the message manager with a Neo4j driver.
         
         Args:
-            neo4j_driver: Neo4j driver instance for database operations
+            neo4j_driver: Async Neo4j driver instance for database operations
+            write_timeout: Server-side timeout in seconds for message and
+                session writes; None or 0 uses the server default
+            bulk_delete_timeout: Server-side timeout in seconds for deleting
+                or truncating a whole session; None or 0 uses the server default
         """
         self.driver = neo4j_driver
+        self.write_timeout = write_timeout
+        self.bulk_delete_timeout = bulk_delete_timeout
         self.chat_history_group_id = "_chat_history"
     
+    @asynccontextmanager
+    async def _session(self, session=None):
+        """Yield the caller's session, or a new one that is closed on exit."""
+        if session is not None:
+            yield session
+        else:
+            async with self.driver.session() as new_session:
+                yield new_session
+    
+    async def ensure_schema(self) -> None:
+        """
+        Create the constraints and indexes the chat queries rely on.
+        
+        Runs once per process; every statement is idempotent, so concurrent
+        processes may race safely.
+        """
+        if MessageManager._schema_ready:
+            return
+        
+        try:
+            async with self.driver.session() as session:
+                for statement in _SCHEMA_STATEMENTS:
+                    await session.run(statement)
+            MessageManager._schema_ready = True
+            logger.info("[MessageManager] ensured chat constraints and indexes")
+        except Exception as e:
+            logger.warning(f"Could not ensure chat constraints and indexes: {e}")
+    
     async def create_session(self, model: str = None) -> Dict[str, Any]:
         """
         Create a new chat session.
@@ -35,12 +211,13 @@ class MessageManager:
         Returns:
             Dict containing the session information
         """
-        session_id = str(uuid.uuid4())
-        timestamp = datetime.datetime.now().isoformat()
+        session_id = secrets.token_hex(16)
+        timestamp = _timestamp()
         
         try:
-            with self.driver.session() as session:
-                result = session.run(
+            async with self.driver.session() as session:
+                record = await session.execute_write(
+                    _write_tx("create_session", timeout=self.write_timeout),
                     """
                     CREATE (s:ChatSession {
                         id: $id,
@@ -50,7 +227,7 @@ class MessageManager:
                         updated_at: $timestamp,
                         group_id: $group_id
                     })
-                    RETURN s
+                    RETURN s {.id, .name, .model, .created_at, .updated_at} AS s
                     """,
                     {
                         "id": session_id,
@@ -61,19 +238,10 @@ class MessageManager:
                     },
                 )
                 
-                record = result.single()
                 if not record:
                     raise Exception("Failed to create chat session")
                 
-                session_data = record["s"]
-                
-                return {
-                    "id": session_data.get("id"),
-                    "name": session_data.get("name"),
-                    "model": session_data.get("model"),
-                    "created_at": session_data.get("created_at"),
-                    "updated_at": session_data.get("updated_at"),
-                }
+                return record["s"]
         except Exception as e:
             logger.error(f"Error creating chat session: {e}")
             raise
@@ -86,102 +254,88 @@ class MessageManager:
             List of session dictionaries
         """
         try:
-            with self.driver.session() as session:
-                result = session.run(
+            async with self.driver.session() as session:
+                result = await session.run(
                     """
                     MATCH (s:ChatSession {group_id: $group_id})
-                    RETURN s
+                    RETURN s {.id, .name, .model, .created_at, .updated_at} AS s
                     ORDER BY s.updated_at DESC
                     """,
                     {"group_id": self.chat_history_group_id},
                 )
                 
-                sessions = []
-                for record in result:
-                    session_data = record["s"]
-                    sessions.append({
-                        "id": session_data.get("id"),
-                        "name": session_data.get("name"),
-                        "model": session_data.get("model"),
-                        "created_at": session_data.get("created_at"),
-                        "updated_at": session_data.get("updated_at"),
-                    })
-                
-                return sessions
+                # Rows are fetched in one call; each is already a plain map
+                return [record["s"] for record in await result.data()]
         except Exception as e:
             logger.error(f"Error getting chat sessions: {e}")
             raise
     
-    async def get_session_messages(self, session_id: str) -> Dict[str, Any]:
+    async def get_session_messages(
+        self,
+        session_id: str,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
         """
-        Get all messages for a session.
+        Get the messages for a session, optionally one page at a time.
         
         Args:
             session_id: The ID of the session to get messages for
+            limit: Maximum number of messages to return (None for all)
+            offset: Number of leading messages to skip
             
         Returns:
             Dict containing session info and messages
         """
         try:
-            with self.driver.session() as session:
+            async with self.driver.session() as session:
                 # First get the session info
-                session_result = session.run(
+                session_result = await session.run(
                     """
                     MATCH (s:ChatSession {id: $session_id, group_id: $group_id})
-                    RETURN s
+                    RETURN s {.id, .name, .model, .created_at, .updated_at} AS s
                     """,
                     {"session_id": session_id, "group_id": self.chat_history_group_id},
                 )
                 
-                session_record = session_result.single()
+                session_record = await session_result.single()
                 if not session_record:
                     raise Exception(f"Session not found: {session_id}")
                 
                 session_data = session_record["s"]
                 
-                # Then get the messages
-                message_result = session.run(
-                    """
-                    MATCH (s:ChatSession {id: $session_id})-[:CONTAINS]->(m:ChatMessage)
-                    OPTIONAL MATCH (m)-[:HAS_ATTACHMENT]->(a:ChatAttachment)
-                    WITH s, m, collect(a) as attachments
-                    ORDER BY m.timestamp, CASE WHEN m.role = 'user' THEN 0 ELSE 1 END
-                    RETURN m, attachments
-                    """,
-                    {"session_id": session_id},
+                # Then get the requested page of messages
+                message_result = await session.run(
+                    _SESSION_MESSAGES_QUERY % ("LIMIT $limit" if limit is not None else ""),
+                    {"session_id": session_id, "offset": offset, "limit": limit},
                 )
                 
                 messages = []
-                for record in message_result:
+                for record in await message_result.data():
                     message_data = record["m"]
-                    attachment_data = record["attachments"]
-                    
-                    attachments = []
-                    for attachment in attachment_data:
-                        if attachment:
-                            attachments.append({
-                                "id": attachment.get("id"),
-                                "name": attachment.get("name"),
-                                "content_type": attachment.get("content_type"),
-                                "file_path": attachment.get("file_path"),
-                            })
                     
                     message = {
                         "id": message_data.get("id"),
                         "role": message_data.get("role"),
                         "content": message_data.get("content"),
                         "timestamp": message_data.get("timestamp"),
-                        "attachments": attachments,
+                        "attachments": record["attachments"],
                     }
                     
-                    # Handle tool_calls for assistant messages
-                    if message_data.get("role") == "assistant" and message_data.get("tool_calls"):
-                        import json
+                    # Handle tool_calls for assistant messages; natively stored
+                    # lists need no JSON parsing, legacy JSON strings do
+                    if message_data.get("role") == "assistant" and message_data.get("tool_call_ids") is not None:
+                        message["tool_calls"] = _build_tool_calls(
+                            message_data.get("tool_call_ids"),
+                            message_data.get("tool_call_names"),
+                            message_data.get("tool_call_arguments"),
+                        )
+                    elif message_data.get("role") == "assistant" and message_data.get("tool_calls"):
                         try:
                             tool_calls_json = message_data.get("tool_calls")
                             # Ensure we have a string to parse
                             if isinstance(tool_calls_json, str):
-                                message["tool_calls"] = json.loads(tool_calls_json)
+                                message["tool_calls"] = _build_tool_calls(*_parse_tool_calls(tool_calls_json))
                                 logger.info(f"Successfully parsed tool_calls JSON for message {message_data.get('id')}")
                             elif isinstance(tool_calls_json, list):
                                 # Already a list, no need to parse
@@ -201,19 +355,41 @@ class MessageManager:
                     
                     messages.append(message)
                 
-                return {
-                    "id": session_data.get("id"),
-                    "name": session_data.get("name"),
-                    "model": session_data.get("model"),
-                    "created_at": session_data.get("created_at"),
-                    "updated_at": session_data.get("updated_at"),
-                    "messages": messages,
-                }
+                return {**session_data, "messages": messages}
         except Exception as e:
             logger.error(f"Error getting session messages: {e}")
             raise
     
-    async def add_user_message(self, session_id: str, content: str, attachments: List[Dict[str, Any]] = None) -> str:
+    async def get_recent_messages(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get the id, role and content of a session's newest messages.
+        
+        Args:
+            session_id: The ID of the session to get messages for
+            limit: Maximum number of messages to return
+            
+        Returns:
+            List of message dictionaries, newest first
+        """
+        try:
+            async with self.driver.session() as session:
+                result = await session.run(
+                    _RECENT_MESSAGES_QUERY,
+                    {"session_id": session_id, "limit": limit},
+                )
+                return await result.data()
+        except Exception as e:
+            logger.error(f"Error getting recent messages: {e}")
+            raise
+    
+    async def add_user_message(
+        self,
+        session_id: str,
+        content: str,
+        attachments: List[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None,
+        session=None,
+    ) -> str:
         """
         Add a user message to a session.
         
@@ -221,262 +397,201 @@ class MessageManager:
             session_id: The ID of the session to add the message to
             content: The message content
             attachments: List of attachment dictionaries
+            idempotency_key: Optional client token deduplicating retries of this message
+            session: Optional open Neo4j session to reuse across calls
             
         Returns:
             The ID of the created message
         """
-        message_id = str(uuid.uuid4())
-        timestamp = datetime.datetime.now().isoformat()
+        message_id = secrets.token_hex(16)
+        timestamp = _timestamp()
         logger.info(f"[MessageManager] add_user_message: session_id={session_id}, message_id={message_id}, content={content[:100]}")
         
         try:
-            with self.driver.session() as session:
-                # Check if this exact message already exists to prevent duplicates
-                check_result = session.run(
-                    """
-                    MATCH (s:ChatSession {id: $session_id})-[:CONTAINS]->(m:ChatMessage)
-                    WHERE m.role = 'user' AND m.content = $content
-                    RETURN m.id as id
-                    ORDER BY m.timestamp DESC
-                    LIMIT 1
-                    """,
-                    {
-                        "session_id": session_id,
-                        "content": content,
-                    },
-                )
-                
-                existing = check_result.single()
-                if existing:
-                    logger.info(f"[MessageManager] add_user_message: duplicate found, returning existing id={existing['id']}")
-                    # Message already exists, return its ID
-                    return existing["id"]
-                
-                # Store the user message
-                session.run(
-                    """
+            async with self._session(session) as session:
+                # Idempotent insert keyed on the message's dedup key, plus
+                # attachments and session timestamp, as one statement in a
+                # single write transaction; new messages take the next value
+                # of the session's msg_seq counter for strict ordering
+                query = """
                     MATCH (s:ChatSession {id: $session_id, group_id: $group_id})
-                    CREATE (m:ChatMessage {
+                    MERGE (m:ChatMessage {dedup_key: $dedup_key})
+                    ON CREATE SET m += {
                         id: $message_id,
                         role: 'user',
                         content: $content,
                         timestamp: $timestamp
-                    })
-                    CREATE (s)-[:CONTAINS]->(m)
-                    """,
-                    {
-                        "session_id": session_id,
-                        "message_id": message_id,
-                        "content": content,
-                        "timestamp": timestamp,
-                        "group_id": self.chat_history_group_id,
-                    },
-                )
-                
-                # Store file attachments if any
-                if attachments:
-                    for attachment in attachments:
-                        session.run(
-                            """
-                            MATCH (m:ChatMessage {id: $message_id})
-                            CREATE (a:ChatAttachment {
-                                id: $attachment_id,
-                                name: $name,
-                                content_type: $content_type,
-                                file_path: $file_path
+                    }
+                    WITH s, m, m.id = $message_id AS created
+                    FOREACH (_ IN CASE WHEN created THEN [1] ELSE [] END |
+                        SET s.msg_seq = coalesce(s.msg_seq, 0) + 1
+                        SET m.seq = s.msg_seq
+                        CREATE (s)-[:CONTAINS]->(m)
+                        FOREACH (attachment IN $attachments |
+                            CREATE (m)-[:HAS_ATTACHMENT]->(:ChatAttachment {
+                                id: attachment.id,
+                                name: attachment.name,
+                                content_type: attachment.content_type,
+                                file_path: attachment.file_path
                             })
-                            CREATE (m)-[:HAS_ATTACHMENT]->(a)
-                            """,
-                            {
-                                "message_id": message_id,
-                                "attachment_id": attachment["id"],
-                                "name": attachment["name"],
-                                "content_type": attachment["content_type"],
-                                "file_path": attachment["file_path"],
-                            },
                         )
-                        logger.info(f"[MessageManager] add_user_message: stored attachment id={attachment['id']}")
-                
-                # Update session timestamp
-                session.run(
-                    """
-                    MATCH (s:ChatSession {id: $session_id})
+                    )
                     SET s.updated_at = $timestamp
-                    """,
-                    {"session_id": session_id, "timestamp": timestamp},
+                    RETURN m.id AS id, NOT created AS duplicate
+                    """
+                params = {
+                    "session_id": session_id,
+                    "message_id": message_id,
+                    "dedup_key": _dedup_key(session_id, "user", content, idempotency_key),
+                    "content": content,
+                    "timestamp": timestamp,
+                    "attachments": attachments or [],
+                    "group_id": self.chat_history_group_id,
+                }
+                record = await session.execute_write(
+                    _write_tx("add_user_message", timeout=self.write_timeout), query, params
                 )
                 
+                if record and record["duplicate"]:
+                    logger.info(f"[MessageManager] add_user_message: duplicate found, returning existing id={record['id']}")
+                    # Message already exists, return its ID
+                    return record["id"]
+                
                 logger.info(f"[MessageManager] add_user_message: successfully stored user message id={message_id}")
                 return message_id
         except Exception as e:
             logger.error(f"Error adding user message: {e}")
             raise
     
-    async def add_assistant_message(self, session_id: str, content: str, tool_calls: Optional[str] = None) -> str:
+    async def add_assistant_message(
+        self,
+        session_id: str,
+        content: str,
+        tool_calls: Optional[Union[str, List[Dict[str, Any]]]] = None,
+        idempotency_key: Optional[str] = None,
+        session=None,
+    ) -> str:
         """
-        Add an assistant message to a session, optionally including tool_calls as JSON.
+        Add an assistant message to a session, optionally including tool_calls.
 
         Args:
             session_id: The ID of the session to add the message to
             content: The message content
-            tool_calls: (Optional) JSON string of tool_calls
+            tool_calls: (Optional) tool_calls as a list or a JSON string
+            idempotency_key: (Optional) client token deduplicating retries of this message
+            session: (Optional) open Neo4j session to reuse across calls
 
         Returns:
             The ID of the created message
         """
-        import json as _json
-        message_id = str(uuid.uuid4())
-        # Add a small delay to the timestamp to ensure it's after the user message
-        timestamp = (datetime.datetime.now() + datetime.timedelta(seconds=1)).isoformat()
+        message_id = secrets.token_hex(16)
+        timestamp = _timestamp()
         logger.info(f"[MessageManager] add_assistant_message: session_id={session_id}, message_id={message_id}, content={content[:100]}, tool_calls={'yes' if tool_calls else 'no'}")
+        # JSON strings are decoded once with orjson, then stored as native
+        # list properties like structured messages
+        if isinstance(tool_calls, str):
+            tool_calls = orjson.loads(tool_calls)
+        tool_call_props = _flatten_tool_calls(tool_calls) if tool_calls else {}
 
         try:
-            with self.driver.session() as session:
-                # Check if this exact message already exists to prevent duplicates
-                check_result = session.run(
-                    """
-                    MATCH (s:ChatSession {id: $session_id})-[:CONTAINS]->(m:ChatMessage)
-                    WHERE m.role = 'assistant' AND m.content = $content
-                    RETURN m.id as id
-                    ORDER BY m.timestamp DESC
-                    LIMIT 1
-                    """,
-                    {
-                        "session_id": session_id,
-                        "content": content,
-                    },
-                )
-
-                existing = check_result.single()
-                if existing:
-                    logger.info(f"[MessageManager] add_assistant_message: duplicate found, returning existing id={existing['id']}")
-                    # Message already exists, return its ID
-                    return existing["id"]
-
-                # Store the assistant message, including tool_calls if present
-                if tool_calls is not None:
-                    session.run(
-                        """
-                        MATCH (s:ChatSession {id: $session_id})
-                        CREATE (m:ChatMessage {
-                            id: $message_id,
-                            role: 'assistant',
-                            content: $content,
-                            tool_calls: $tool_calls,
-                            timestamp: $timestamp
-                        })
-                        CREATE (s)-[:CONTAINS]->(m)
-                        """,
-                        {
-                            "session_id": session_id,
-                            "message_id": message_id,
-                            "content": content,
-                            "tool_calls": tool_calls,
-                            "timestamp": timestamp,
-                        },
-                    )
-                else:
-                    session.run(
-                        """
-                        MATCH (s:ChatSession {id: $session_id})
-                        CREATE (m:ChatMessage {
-                            id: $message_id,
-                            role: 'assistant',
-                            content: $content,
-                            timestamp: $timestamp
-                        })
+            async with self._session(session) as session:
+                # Idempotent insert keyed on the message's dedup key, plus the
+                # session timestamp, as one statement in a single write
+                # transaction; null tool call lists are simply not stored
+                query = """
+                    MATCH (s:ChatSession {id: $session_id})
+                    MERGE (m:ChatMessage {dedup_key: $dedup_key})
+                    ON CREATE SET m += {
+                        id: $message_id,
+                        role: 'assistant',
+                        content: $content,
+                        tool_call_ids: $tool_call_ids,
+                        tool_call_names: $tool_call_names,
+                        tool_call_arguments: $tool_call_arguments,
+                        timestamp: $timestamp
+                    }
+                    WITH s, m, m.id = $message_id AS created
+                    FOREACH (_ IN CASE WHEN created THEN [1] ELSE [] END |
+                        SET s.msg_seq = coalesce(s.msg_seq, 0) + 1
+                        SET m.seq = s.msg_seq
                         CREATE (s)-[:CONTAINS]->(m)
-                        """,
-                        {
-                            "session_id": session_id,
-                            "message_id": message_id,
-                            "content": content,
-                            "timestamp": timestamp,
-                        },
                     )
-
-                # Update session timestamp
-                session.run(
-                    """
-                    MATCH (s:ChatSession {id: $session_id})
                     SET s.updated_at = $timestamp
-                    """,
-                    {"session_id": session_id, "timestamp": timestamp},
+                    RETURN m.id AS id, NOT created AS duplicate
+                    """
+                params = {
+                    "session_id": session_id,
+                    "message_id": message_id,
+                    "dedup_key": _dedup_key(session_id, "assistant", content, idempotency_key),
+                    "content": content,
+                    "tool_call_ids": tool_call_props.get("ids"),
+                    "tool_call_names": tool_call_props.get("names"),
+                    "tool_call_arguments": tool_call_props.get("arguments"),
+                    "timestamp": timestamp,
+                }
+                record = await session.execute_write(
+                    _write_tx("add_assistant_message", timeout=self.write_timeout), query, params
                 )
-
+                
+                if record and record["duplicate"]:
+                    logger.info(f"[MessageManager] add_assistant_message: duplicate found, returning existing id={record['id']}")
+                    # Message already exists, return its ID
+                    return record["id"]
+                
                 logger.info(f"[MessageManager] add_assistant_message: successfully stored assistant message id={message_id}")
                 return message_id
         except Exception as e:
             logger.error(f"Error adding assistant message: {e}")
             raise
 
-    async def add_structured_assistant_message(self, session_id: str, message: dict) -> str:
+    async def add_structured_assistant_message(self, session_id: str, message: dict, session=None) -> str:
         """
         Add a fully structured assistant message (including tool_calls and any other fields).
 
         Args:
             session_id: The ID of the session to add the message to
             message: The full assistant message dict (should include at least 'content', may include 'tool_calls', etc.)
+            session: (Optional) open Neo4j session to reuse across calls
 
         Returns:
             The ID of the created message
         """
-        import json as _json
-        message_id = str(uuid.uuid4())
-        timestamp = (datetime.datetime.now() + datetime.timedelta(seconds=1)).isoformat()
+        message_id = secrets.token_hex(16)
+        timestamp = _timestamp()
         content = message.get("content", "")
         tool_calls = message.get("tool_calls", None)
-        # Store as JSON string for tool_calls if present
-        tool_calls_json = _json.dumps(tool_calls) if tool_calls is not None else None
+        # Store tool_calls as native list properties; null lists are not stored
+        tool_call_props = _flatten_tool_calls(tool_calls) if tool_calls is not None else {}
 
         try:
-            with self.driver.session() as session:
-                if tool_calls_json is not None:
-                    session.run(
-                        """
-                        MATCH (s:ChatSession {id: $session_id})
-                        CREATE (m:ChatMessage {
-                            id: $message_id,
-                            role: 'assistant',
-                            content: $content,
-                            tool_calls: $tool_calls,
-                            timestamp: $timestamp
-                        })
-                        CREATE (s)-[:CONTAINS]->(m)
-                        """,
-                        {
-                            "session_id": session_id,
-                            "message_id": message_id,
-                            "content": content,
-                            "tool_calls": tool_calls_json,
-                            "timestamp": timestamp,
-                        },
-                    )
-                else:
-                    session.run(
-                        """
-                        MATCH (s:ChatSession {id: $session_id})
-                        CREATE (m:ChatMessage {
-                            id: $message_id,
-                            role: 'assistant',
-                            content: $content,
-                            timestamp: $timestamp
-                        })
-                        CREATE (s)-[:CONTAINS]->(m)
-                        """,
-                        {
-                            "session_id": session_id,
-                            "message_id": message_id,
-                            "content": content,
-                            "timestamp": timestamp,
-                        },
-                    )
-                session.run(
+            async with self._session(session) as session:
+                await session.execute_write(
+                    _write_tx("add_structured_assistant_message", single=False, timeout=self.write_timeout),
                     """
                     MATCH (s:ChatSession {id: $session_id})
+                    SET s.msg_seq = coalesce(s.msg_seq, 0) + 1
+                    CREATE (m:ChatMessage {
+                        id: $message_id,
+                        role: 'assistant',
+                        content: $content,
+                        tool_call_ids: $tool_call_ids,
+                        tool_call_names: $tool_call_names,
+                        tool_call_arguments: $tool_call_arguments,
+                        timestamp: $timestamp,
+                        seq: s.msg_seq
+                    })
+                    CREATE (s)-[:CONTAINS]->(m)
                     SET s.updated_at = $timestamp
                     """,
-                    {"session_id": session_id, "timestamp": timestamp},
+                    {
+                        "session_id": session_id,
+                        "message_id": message_id,
+                        "content": content,
+                        "tool_call_ids": tool_call_props.get("ids"),
+                        "tool_call_names": tool_call_props.get("names"),
+                        "tool_call_arguments": tool_call_props.get("arguments"),
+                        "timestamp": timestamp,
+                    },
                 )
                 return message_id
         except Exception as e:
@@ -491,6 +606,7 @@ class MessageManager:
         tool_call_id: str = "",
         index: int = 0,
         timestamp: float = None,
+        session=None,
     ) -> str:
         """
         Add a tool message to a session.
@@ -502,26 +618,30 @@ class MessageManager:
             tool_call_id: The tool call ID (if any)
             index: The index/order of the message in the session
             timestamp: The timestamp (float, seconds since epoch). If None, use now.
+            session: (Optional) open Neo4j session to reuse across calls
 
         Returns:
             The ID of the created message
         """
-        message_id = str(uuid.uuid4())
+        message_id = secrets.token_hex(16)
         if timestamp is None:
-            timestamp_str = datetime.datetime.now().isoformat()
+            timestamp_str = _timestamp()
         else:
             # Accept both float (epoch) and iso string
             if isinstance(timestamp, (float, int)):
-                timestamp_str = datetime.datetime.fromtimestamp(timestamp).isoformat()
+                timestamp_str = datetime.datetime.fromtimestamp(timestamp).isoformat(timespec="microseconds")
             else:
                 timestamp_str = str(timestamp)
         logger.info(f"[MessageManager] add_tool_message: session_id={session_id}, message_id={message_id}, name={name}, tool_call_id={tool_call_id}, content={content[:100]}")
         try:
-            with self.driver.session() as session:
-                # Store the tool message
-                session.run(
+            async with self._session(session) as session:
+                # Store the tool message and bump the session timestamp in one
+                # round trip
+                await session.execute_write(
+                    _write_tx("add_tool_message", single=False, timeout=self.write_timeout),
                     """
                     MATCH (s:ChatSession {id: $session_id})
+                    SET s.msg_seq = coalesce(s.msg_seq, 0) + 1
                     CREATE (m:ChatMessage {
                         id: $message_id,
                         role: 'tool',
@@ -529,9 +649,11 @@ class MessageManager:
                         name: $name,
                         tool_call_id: $tool_call_id,
                         index: $index,
-                        timestamp: $timestamp
+                        timestamp: $timestamp,
+                        seq: s.msg_seq
                     })
                     CREATE (s)-[:CONTAINS]->(m)
+                    SET s.updated_at = $timestamp
                     """,
                     {
                         "session_id": session_id,
@@ -543,65 +665,125 @@ class MessageManager:
                         "timestamp": timestamp_str,
                     },
                 )
-                # Update session timestamp
-                session.run(
+                logger.info(f"[MessageManager] add_tool_message: successfully stored tool message id={message_id}")
+                return message_id
+        except Exception as e:
+            logger.error(f"Error adding tool message: {e}")
+            raise
+
+    async def add_messages_bulk(
+        self,
+        session_id: str,
+        messages: List[Dict[str, Any]],
+        session=None,
+    ) -> List[str]:
+        """
+        Add several messages to a session in a single round trip.
+
+        Callers accumulate the messages of a turn (assistant, tool calls and
+        tool results) and flush them once, instead of one add_* call each.
+
+        Args:
+            session_id: The ID of the session to add the messages to
+            messages: Message dicts with 'role' and 'content', and optionally
+                'name', 'tool_call_id' and 'tool_calls'
+            session: Optional open Neo4j session to reuse across calls
+
+        Returns:
+            The IDs of the created messages, in input order
+        """
+        if not messages:
+            return []
+
+        timestamp = _timestamp()
+        rows = []
+        for message in messages:
+            row = {
+                "id": secrets.token_hex(16),
+                "role": message.get("role"),
+                "content": message.get("content", ""),
+                "name": message.get("name"),
+                "tool_call_id": message.get("tool_call_id"),
+                "timestamp": timestamp,
+            }
+            if message.get("tool_calls") is not None:
+                tool_call_props = _flatten_tool_calls(message["tool_calls"])
+                row["tool_call_ids"] = tool_call_props["ids"]
+                row["tool_call_names"] = tool_call_props["names"]
+                row["tool_call_arguments"] = tool_call_props["arguments"]
+            rows.append(row)
+        logger.info(f"[MessageManager] add_messages_bulk: session_id={session_id}, count={len(rows)}")
+
+        try:
+            async with self._session(session) as session:
+                # Reserve a block of sequence numbers, then create every
+                # message from its property map; null properties are not
+                # stored. The counter is written before it is read so the
+                # session's write lock is held and concurrent turns never
+                # reserve overlapping blocks.
+                await session.execute_write(
+                    _write_tx("add_messages_bulk", single=False, timeout=self.write_timeout),
                     """
                     MATCH (s:ChatSession {id: $session_id})
-                    SET s.updated_at = $timestamp
+                    SET s.msg_seq = coalesce(s.msg_seq, 0) + size($messages), s.updated_at = $timestamp
+                    WITH s, s.msg_seq - size($messages) AS base
+                    UNWIND range(0, size($messages) - 1) AS i
+                    CREATE (m:ChatMessage)
+                    SET m = $messages[i], m.seq = base + i + 1
+                    CREATE (s)-[:CONTAINS]->(m)
                     """,
-                    {"session_id": session_id, "timestamp": timestamp_str},
+                    {"session_id": session_id, "messages": rows, "timestamp": timestamp},
                 )
-                logger.info(f"[MessageManager] add_tool_message: successfully stored tool message id={message_id}")
-                return message_id
+                return [row["id"] for row in rows]
         except Exception as e:
-            logger.error(f"Error adding tool message: {e}")
+            logger.error(f"Error adding messages in bulk: {e}")
             raise
-    
-    async def update_session(self, session_id: str, **kwargs) -> Dict[str, Any]:
+
+    async def update_session(
+        self,
+        session_id: str,
+        name: Optional[str] = None,
+        model: Optional[str] = None,
+        session=None,
+    ) -> Dict[str, Any]:
         """
         Update session properties.
         
         Args:
             session_id: The ID of the session to update
-            **kwargs: Key-value pairs of properties to update
+            name: New session name (None leaves it unchanged)
+            model: New session model (None leaves it unchanged)
+            session: Optional open Neo4j session to reuse across calls
             
         Returns:
             Dict containing the updated session information
         """
         try:
-            # Add updated_at timestamp
-            kwargs["updated_at"] = datetime.datetime.now().isoformat()
-            
-            # Build the Cypher query dynamically based on what's being updated
-            set_clause = ", ".join([f"s.{key} = ${key}" for key in kwargs.keys()])
-            query = f"""
-            MATCH (s:ChatSession {{id: $session_id, group_id: $group_id}})
-            SET {set_clause}
-            RETURN s
+            # One fixed, parameterized statement for every combination of
+            # updated properties, so Neo4j plans it once
+            query = """
+            MATCH (s:ChatSession {id: $session_id, group_id: $group_id})
+            SET s.name = coalesce($name, s.name),
+                s.model = coalesce($model, s.model),
+                s.updated_at = $updated_at
+            RETURN s {.id, .name, .model, .updated_at} AS s
             """
-            
-            # Add session_id to the parameters
             params = {
-                **kwargs,
+                "name": name,
+                "model": model,
+                "updated_at": _timestamp(),
                 "session_id": session_id,
                 "group_id": self.chat_history_group_id,
             }
             
-            with self.driver.session() as session:
-                result = session.run(query, params)
-                
-                record = result.single()
+            async with self._session(session) as session:
+                record = await session.execute_write(
+                    _write_tx("update_session", timeout=self.write_timeout), query, params
+                )
                 if not record:
                     raise Exception(f"Session not found: {session_id}")
                 
-                session_data = record["s"]
-                
-                return {
-                    "id": session_data.get("id"),
-                    "name": session_data.get("name"),
-                    "model": session_data.get("model"),
-                    "updated_at": session_data.get("updated_at"),
-                }
+                return record["s"]
         except Exception as e:
             logger.error(f"Error updating session: {e}")
             raise
@@ -617,47 +799,23 @@ class MessageManager:
             True if successful
         """
         try:
-            with self.driver.session() as session:
-                # First, get the session to confirm it exists
-                session_result = session.run(
+            async with self.driver.session() as session:
+                # Delete the session, its messages and their attachments in one
+                # traversal; nothing deleted means the session did not exist
+                summary = await session.execute_write(
+                    _write_tx("delete_session", single=False, timeout=self.bulk_delete_timeout),
                     """
                     MATCH (s:ChatSession {id: $session_id, group_id: $group_id})
-                    RETURN s
+                    OPTIONAL MATCH (s)-[:CONTAINS]->(m:ChatMessage)
+                    OPTIONAL MATCH (m)-[:HAS_ATTACHMENT]->(a:ChatAttachment)
+                    DETACH DELETE a, m, s
                     """,
                     {"session_id": session_id, "group_id": self.chat_history_group_id},
                 )
                 
-                session_record = session_result.single()
-                if not session_record:
+                if not summary.counters.nodes_deleted:
                     raise Exception(f"Session not found: {session_id}")
                 
-                # Delete all attachments related to messages in this session
-                session.run(
-                    """
-                    MATCH (s:ChatSession {id: $session_id})-[:CONTAINS]->(m:ChatMessage)-[:HAS_ATTACHMENT]->(a:ChatAttachment)
-                    DETACH DELETE a
-                    """,
-                    {"session_id": session_id},
-                )
-                
-                # Delete all messages in this session
-                session.run(
-                    """
-                    MATCH (s:ChatSession {id: $session_id})-[:CONTAINS]->(m:ChatMessage)
-                    DETACH DELETE m
-                    """,
-                    {"session_id": session_id},
-                )
-                
-                # Finally, delete the session itself
-                session.run(
-                    """
-                    MATCH (s:ChatSession {id: $session_id})
-                    DETACH DELETE s
-                    """,
-                    {"session_id": session_id},
-                )
-                
                 return True
         except Exception as e:
             logger.error(f"Error deleting session: {e}")
@@ -675,59 +833,33 @@ class MessageManager:
             True if successful
         """
         try:
-            timestamp = datetime.datetime.now().isoformat()
+            # Negative indexes leave the session untouched
+            if index < 0:
+                return True
+            
+            timestamp = _timestamp()
             
-            with self.driver.session() as session:
-                # Get all messages for this session
-                messages_result = session.run(
+            async with self.driver.session() as session:
+                # Rank, select and delete the trailing messages server-side in
+                # one round trip; the session timestamp is only touched when
+                # something was deleted
+                await session.execute_write(
+                    _write_tx("truncate_session", single=False, timeout=self.bulk_delete_timeout),
                     """
                     MATCH (s:ChatSession {id: $session_id})-[:CONTAINS]->(m:ChatMessage)
-                    RETURN m
-                    ORDER BY m.timestamp
+                    WITH s, m
+                    ORDER BY coalesce(m.seq, 0), m.timestamp
+                    WITH s, collect(m) AS messages
+                    UNWIND range($index + 1, size(messages) - 1) AS i
+                    WITH s, messages[i] AS m
+                    OPTIONAL MATCH (m)-[:HAS_ATTACHMENT]->(a:ChatAttachment)
+                    DETACH DELETE a, m
+                    WITH DISTINCT s
+                    SET s.updated_at = $timestamp
                     """,
-                    {"session_id": session_id}
+                    {"session_id": session_id, "index": index, "timestamp": timestamp}
                 )
                 
-                messages = list(messages_result)
-                
-                # If index is valid, delete all messages after that index
-                if index >= 0 and index < len(messages):
-                    # Get the IDs of messages to delete
-                    message_ids_to_delete = [
-                        record["m"]["id"] for record in messages[index + 1:]
-                    ]
-                    
-                    if message_ids_to_delete:
-                        # Delete attachments for these messages
-                        session.run(
-                            """
-                            MATCH (m:ChatMessage)-[:HAS_ATTACHMENT]->(a:ChatAttachment)
-                            WHERE m.id IN $message_ids
-                            DETACH DELETE a
-                            """,
-                            {"message_ids": message_ids_to_delete}
-                        )
-                        
-                        # Delete the messages
-                        session.run(
-                            """
-                            MATCH (s:ChatSession {id: $session_id})-[:CONTAINS]->(m:ChatMessage)
-                            WHERE m.id IN $message_ids
-                            DETACH DELETE m
-                            """,
-                            {"session_id": session_id, "message_ids": message_ids_to_delete}
-                        )
-                        
-                        # Update session timestamp
-                        session.run(
-                            """
-                            MATCH (s:ChatSession {id: $session_id})
-                            SET s.updated_at = $timestamp
-                            RETURN s
-                            """,
-                            {"session_id": session_id, "timestamp": timestamp}
-                        )
-                
                 return True
         except Exception as e:
             logger.error(f"Error truncating session: {e}")
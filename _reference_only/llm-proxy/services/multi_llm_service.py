@@ -1,15 +1,18 @@
+import io
 import os
 import re
-import json
 import time
 import math
 import asyncio
 import logging
 import hashlib
+from collections import defaultdict
 from functools import lru_cache, wraps
 from typing import Any, Callable, Dict, List, Optional, Union, Tuple, AsyncGenerator, Protocol
 
+import httpx
 import litellm  # liteLLM universal SDK
+import orjson
 from litellm.utils import token_counter
 from mcp_tools.shared.message_manager import MessageManager 
 from .mcp_client import MCPClient
@@ -40,19 +43,21 @@ class Tool:
         """
         args_desc = []
         if "properties" in self.input_schema:
+            required = set(self.input_schema.get("required") or ())
             for param_name, param_info in self.input_schema["properties"].items():
                 arg_desc = (
                     f"- {param_name}: {param_info.get('description', 'No description')}"
                 )
-                if param_name in self.input_schema.get("required", []):
+                if param_name in required:
                     arg_desc += " (required)"
                 args_desc.append(arg_desc)
+        args_text = "\n".join(args_desc)
 
         return f"""
 Tool: {self.name}
 Description: {self.description}
 Arguments:
-{chr(10).join(args_desc)}
+{args_text}
 """
 
 
@@ -72,7 +77,34 @@ _llm_response_cache: Dict[str, Any] = {}
 
 # Model listing and caching (TTL 60s)
 _model_list_cache: Dict[str, Tuple[float, List[str]]] = {}
-import httpx
+_model_list_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+# Keep-alive HTTP client shared by every model-listing request, created lazily
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+_HTTP_CLIENT_LOCK = asyncio.Lock()
+
+
+async def _get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        async with _HTTP_CLIENT_LOCK:
+            # Re-check: another coroutine may have created it while we waited
+            if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+                _HTTP_CLIENT = httpx.AsyncClient(
+                    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+                    timeout=5
+                )
+    return _HTTP_CLIENT
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client, if it was ever created."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
+
 
 async def get_available_models(provider: Optional[str] = None, force_refresh: bool = False) -> List[str]:
     """
@@ -96,95 +128,180 @@ async def get_available_models(provider: Optional[str] = None, force_refresh: bo
             ts, models = _model_list_cache[provider]
             if now - ts < ttl:
                 return models
-        try:
-            models = []
-            if provider == "openai":
-                try:
-                    import openai
-                    from openai import AsyncOpenAI
-
-                    api_key = os.getenv("OPENAI_API_KEY")
-                    api_base = os.getenv("OPENAI_API_BASE")
-
-                    aclient = AsyncOpenAI(api_key=api_key, base_url=api_base) if hasattr(openai, "AsyncOpenAI") else openai.OpenAI(
-                        api_key=api_key
-                    )
-
-                    if hasattr(openai.Model, "alist"):
-                        resp = await aclient.models.list()
-                        # Handle both OpenAI v1+ (AsyncPage[Model]) and legacy dict response
-                        if isinstance(resp, dict) and "data" in resp:
-                            models = [m["id"] for m in resp["data"]]
+        # Single flight: one coroutine refreshes a provider while the others wait
+        async with _model_list_locks[provider]:
+            # Re-check: a concurrent caller may have refreshed the cache while
+            # we waited; a forced refresh only accepts entries newer than its call
+            if provider in _model_list_cache:
+                ts, models = _model_list_cache[provider]
+                if (ts >= now if force_refresh else time.time() - ts < ttl):
+                    return models
+            try:
+                models = []
+                if provider == "openai":
+                    try:
+                        import openai
+                        from openai import AsyncOpenAI
+
+                        api_key = os.getenv("OPENAI_API_KEY")
+                        api_base = os.getenv("OPENAI_API_BASE")
+
+                        aclient = AsyncOpenAI(api_key=api_key, base_url=api_base) if hasattr(openai, "AsyncOpenAI") else openai.OpenAI(
+                            api_key=api_key
+                        )
+
+                        if hasattr(openai.Model, "alist"):
+                            resp = await aclient.models.list()
+                            # Handle both OpenAI v1+ (AsyncPage[Model]) and legacy dict response
+                            if isinstance(resp, dict) and "data" in resp:
+                                models = [m["id"] for m in resp["data"]]
+                            else:
+                                # OpenAI v1+ returns AsyncPage[Model], which is an async iterable
+                                models = [m.id async for m in resp]
                         else:
-                            # OpenAI v1+ returns AsyncPage[Model], which is an async iterable
-                            models = [m.id async for m in resp]
-                    else:
-                        # Fallback to HTTPX
-                        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-                        base = api_base or "https://api.openai.com/v1"
-                        async with httpx.AsyncClient(timeout=5) as client:
+                            # Fallback to HTTPX
+                            headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+                            base = api_base or "https://api.openai.com/v1"
+                            client = await _get_http_client()
                             resp = await client.get(f"{base}/models", headers=headers)
                             resp.raise_for_status()
                             data = resp.json()
                             models = [m["id"] for m in data.get("data", [])]
-                except Exception as e:
-                    logger.warning(f"OpenAI model listing failed: {e}")
-            elif provider == "anthropic":
-                # No public API for model listing; return known models
-                models = [
-                    "claude-3-opus-20240229",
-                    "claude-3-sonnet-20240229",
-                    "claude-3-haiku-20240307",
-                    "claude-2.1",
-                    "claude-2.0",
-                    "claude-instant-1.2",
-                ]
-            elif provider == "ollama":
-                base = os.getenv("OLLAMA_API_BASE", "http://localhost:11434")
-                try:
-                    async with httpx.AsyncClient(timeout=5) as client:
+                    except Exception as e:
+                        logger.warning(f"OpenAI model listing failed: {e}")
+                elif provider == "anthropic":
+                    # No public API for model listing; return known models
+                    models = [
+                        "claude-3-opus-20240229",
+                        "claude-3-sonnet-20240229",
+                        "claude-3-haiku-20240307",
+                        "claude-2.1",
+                        "claude-2.0",
+                        "claude-instant-1.2",
+                    ]
+                elif provider == "ollama":
+                    base = os.getenv("OLLAMA_API_BASE", "http://localhost:11434")
+                    try:
+                        client = await _get_http_client()
                         resp = await client.get(f"{base}/api/tags")
                         resp.raise_for_status()
                         data = resp.json()
                         models = [m["name"] for m in data.get("models", [])]
-                except Exception as e:
-                    logger.warning(f"Ollama model listing failed: {e}")
-            elif provider == "lm_studio":
-                base = os.getenv("LM_STUDIO_API_BASE", "http://localhost:1234")
-                try:
-                    async with httpx.AsyncClient(timeout=5) as client:
+                    except Exception as e:
+                        logger.warning(f"Ollama model listing failed: {e}")
+                elif provider == "lm_studio":
+                    base = os.getenv("LM_STUDIO_API_BASE", "http://localhost:1234")
+                    try:
+                        client = await _get_http_client()
                         resp = await client.get(f"{base}/models")
                         resp.raise_for_status()
                         data = resp.json()
                         models = [m["id"] for m in data.get("data", [])]
-                except Exception as e:
-                    logger.warning(f"LM Studio model listing failed: {e}")
-            else:
-                logger.warning(f"Unknown provider for model listing: {provider}")
-            # Convert to list of objects with name, provider, full_name
-            model_objs = [
-                {
-                    "name": model,
-                    "provider": provider,
-                    "full_name": f"{provider}/{model}"
-                }
-                for model in models
-            ]
-            _model_list_cache[provider] = (now, model_objs)
-            return model_objs
-        except Exception as e:
-            logger.warning(f"Model listing failed for {provider}: {e}")
-            return []
-    # If provider is None, list for all
+                    except Exception as e:
+                        logger.warning(f"LM Studio model listing failed: {e}")
+                else:
+                    logger.warning(f"Unknown provider for model listing: {provider}")
+                # Convert to list of objects with name, provider, full_name
+                model_objs = [
+                    {
+                        "name": model,
+                        "provider": provider,
+                        "full_name": f"{provider}/{model}"
+                    }
+                    for model in models
+                ]
+                # Drop expired provider lists rather than keeping them around
+                for stale in [p for p, (ts, _) in _model_list_cache.items() if now - ts >= ttl]:
+                    del _model_list_cache[stale]
+                _model_list_cache[provider] = (now, model_objs)
+                return model_objs
+            except Exception as e:
+                logger.warning(f"Model listing failed for {provider}: {e}")
+                return []
+    # If provider is None, list for all providers concurrently
+    results = await asyncio.gather(
+        *(get_available_models(prov, force_refresh=force_refresh) for prov in providers),
+        return_exceptions=True
+    )
     all_models = []
-    for prov in providers:
-        try:
-            prov_models = await get_available_models(prov, force_refresh=force_refresh)
+    for prov, prov_models in zip(providers, results):
+        if isinstance(prov_models, Exception):
+            logger.warning(f"Model listing failed for {prov}: {prov_models}")
+        else:
             all_models.extend(prov_models)
-        except Exception as e:
-            logger.warning(f"Model listing failed for {prov}: {e}")
     return all_models
 
+# ---------------------------------------------------------------------------
+# 📡  S S E   E N C O D I N G
+# ---------------------------------------------------------------------------
+# Content deltas dominate the stream, so their JSON envelope is pre-built and
+# only the delta text itself is encoded per chunk.
+_SSE_CONTENT_PREFIX = '{"type":"content","content":'
+_SSE_TOOL_RESULT_PREFIX = '{"type":"tool_result","name":'
+
+
+def _encode_sse_event(event: Dict[str, Any]) -> str:
+    """Serialize a stream event to the JSON text sent as an SSE data field."""
+    return orjson.dumps(event).decode()
+
+
+def _encode_sse_content(content: str) -> str:
+    """Serialize a content delta without building an intermediate dict."""
+    return _SSE_CONTENT_PREFIX + orjson.dumps(content).decode() + "}"
+
+
+def _encode_sse_tool_result(name: str, result_json: str) -> str:
+    """Serialize a tool result event around an already JSON-encoded result."""
+    return _SSE_TOOL_RESULT_PREFIX + orjson.dumps(name).decode() + ',"result":' + result_json + "}"
+
+
+# ---------------------------------------------------------------------------
+# 🧩  T O O L - C A L L   D E L T A S
+# ---------------------------------------------------------------------------
+# Streamed tool-call deltas are classified by a bit mask of the fields they
+# carry (1 = id, 2 = name, 4 = arguments) and dispatched through a table.
+# Every handler returns the id that later argument-only deltas extend.
+# Argument fragments accumulate as UTF-8 in a bytearray, which grows in
+# place instead of copying the whole string on every delta.
+
+def _tc_new_call(buffers, active_ids, last_id, tc_id, tc_name, tc_args):
+    """New tool call (has both id and name)."""
+    buffers[tc_id] = {"name": tc_name, "args": bytearray()}
+    active_ids.add(tc_id)
+    return tc_id
+
+def _tc_new_call_with_args(buffers, active_ids, last_id, tc_id, tc_name, tc_args):
+    """New tool call whose first delta already carries arguments."""
+    buffers[tc_id] = {"name": tc_name, "args": bytearray(tc_args.encode())}
+    active_ids.add(tc_id)
+    return tc_id
+
+def _tc_append_to_last(buffers, active_ids, last_id, tc_id, tc_name, tc_args):
+    """Continuation of the most recent tool call (arguments but no usable id)."""
+    if last_id:
+        # Fallback: start a buffer for the recent id if none exists yet
+        if last_id not in buffers:
+            buffers[last_id] = {"name": "unknown", "args": bytearray()}
+            active_ids.add(last_id)
+        buffers[last_id]["args"].extend(tc_args.encode())
+    return last_id
+
+def _tc_append_by_id(buffers, active_ids, last_id, tc_id, tc_name, tc_args):
+    """Arguments for a specific tool call (has id but no name)."""
+    if tc_id in buffers:
+        buffers[tc_id]["args"].extend(tc_args.encode())
+        return last_id
+    return _tc_append_to_last(buffers, active_ids, last_id, tc_id, tc_name, tc_args)
+
+_TOOL_CALL_DELTA_HANDLERS: Dict[int, Callable[..., Optional[str]]] = {
+    3: _tc_new_call,
+    7: _tc_new_call_with_args,
+    5: _tc_append_by_id,
+    4: _tc_append_to_last,
+    6: _tc_append_to_last,
+}
+
+
 # ---------------------------------------------------------------------------
 # 🧮  T O K E N   U T I L S
 # ---------------------------------------------------------------------------
@@ -201,31 +318,144 @@ TOKEN_SAFETY_BUFFER = 1000
 
 class _MessageTokenManager:
     @staticmethod
+    @lru_cache(maxsize=256)
     def model_limit(model: str) -> int:
+        # Memoized: the same model string is looked up for every truncation
         base = model.split("/")[-1]
         return MODEL_TOKEN_LIMITS.get(base, MODEL_TOKEN_LIMITS["default"])
 
     @staticmethod
     def count(messages: List[Dict[str, Any]], model: str) -> int:
-        total = 0
-        for m in messages:
-            txt = m.get("content", "")
-            total += token_counter(model=model, text=txt)
-            if "tool_calls" in m:
-                total += token_counter(model=model, text=json.dumps(m["tool_calls"]))
-        # small overhead per message
-        return total + len(messages) * 4
+        if not messages:
+            return 0
+        # One batched tokenizer pass over every message's content, which
+        # already includes the per-message formatting overhead...
+        total = token_counter(
+            model=model,
+            messages=[
+                {"role": m.get("role", "user"), "content": m.get("content") or ""}
+                for m in messages
+            ],
+        )
+        # ...and one over all tool calls, joined into a single text
+        tool_calls_text = b"\n".join(
+            orjson.dumps(m["tool_calls"]) for m in messages if "tool_calls" in m
+        ).decode()
+        if tool_calls_text:
+            total += token_counter(model=model, text=tool_calls_text)
+        return total
+
+
+@lru_cache(maxsize=64)
+def _supported_params_for(model: str) -> Optional[frozenset]:
+    """
+    Kwargs litellm accepts for ``model``, or None if it cannot tell.
+
+    Memoized per model so chat completions skip litellm's introspection.
+    """
+    params_from_litellm = litellm.get_supported_openai_params(model)
+    if params_from_litellm is None:
+        return None
+    # Always allow 'api_base', 'api_key', 'api_version' for custom endpoints
+    return frozenset(params_from_litellm) | {"api_base", "api_key", "api_version"}
+
+
+# Capability checks walk litellm's model registry; memoized per model
+
+@lru_cache(maxsize=256)
+def _supports_response_format_cached(model: str) -> bool:
+    # Check if model supports response_format (OpenAI, not e.g. LM Studio)
+    try:
+        params = litellm.get_supported_openai_params(model)
+        return "response_format" in params or model.startswith("lm_studio")
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=256)
+def _supports_tool_calling_cached(model: str) -> bool:
+    # Check if model supports tool-calling
+    try:
+        return litellm.supports_function_calling(model) or model.startswith("lm_studio")
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=256)
+def _supports_reasoning_cached(model: str) -> bool:
+    return hasattr(litellm, "supports_reasoning") and litellm.supports_reasoning(model)
 
 
 # ---------------------------------------------------------------------------
 # 🔨  S C H E M A  /  J S O N  F I X U P
 # ---------------------------------------------------------------------------
 
+# Closing instructions shared by every JSON retry message
+_JSON_RETRY_INSTRUCTIONS = (
+    "Make sure to:\n"
+    "1. Use proper JSON syntax with double quotes for strings\n"
+    "2. Ensure all brackets and braces are properly closed\n"
+    "3. Avoid trailing commas\n"
+    "4. Return ONLY the JSON object, without any additional text or markdown formatting"
+)
+
+def _md_fence_bounds(text: str) -> Optional[Tuple[int, int]]:
+    """Start and end of the first closed ```/```json fenced block's body."""
+    start = text.find("```")
+    if start == -1:
+        return None
+    start += 3
+    if text.startswith("json", start):
+        start += 4
+    end = text.find("```", start)
+    if end == -1:
+        return None
+    return start, end
+
 def _strip_md_json(text: str) -> str:
     if text is None:
         return ""
-    m = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
-    return m.group(1).strip() if m else text
+    bounds = _md_fence_bounds(text)
+    return text[bounds[0]:bounds[1]].strip() if bounds else text
+
+# Characters that matter when scanning for the extent of a JSON value
+_JSON_STRUCTURAL_RE = re.compile(r'[{}\[\]"\\]')
+
+def _find_json_span(text: str, start: int = 0, end: Optional[int] = None) -> Optional[str]:
+    """
+    Return the first balanced JSON object or array in ``text[start:end]``.
+
+    A single linear pass tracks bracket depth and string/escape state, so
+    malformed output can never trigger regex backtracking.
+    """
+    if end is None:
+        end = len(text)
+    openers = [i for i in (text.find("{", start, end), text.find("[", start, end)) if i != -1]
+    if not openers:
+        return None
+    begin = min(openers)
+    depth = 0
+    in_string = False
+    escaped = -1
+    for m in _JSON_STRUCTURAL_RE.finditer(text, begin, end):
+        i = m.start()
+        if i == escaped:
+            continue
+        ch = text[i]
+        if in_string:
+            if ch == "\\":
+                escaped = i + 1
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{" or ch == "[":
+            depth += 1
+        elif ch == "}" or ch == "]":
+            depth -= 1
+            if depth == 0:
+                return text[begin:i + 1]
+    return None
 
 def _unwrap_schema(obj: Any) -> Any:
     """
@@ -237,15 +467,19 @@ def _unwrap_schema(obj: Any) -> Any:
         return [_unwrap_schema(i) for i in obj]
     if isinstance(obj, dict):
         # whole-object schema
-        if set(obj.keys()) >= {"type", "description"} and isinstance(obj["description"], str):
+        if "type" in obj and "description" in obj and isinstance(obj["description"], str):
             return obj["description"]
         # nested description dict: {description: {...}}
-        if set(obj.keys()) == {"description"} and isinstance(obj["description"], dict):
+        if len(obj) == 1 and "description" in obj and isinstance(obj["description"], dict):
             return _unwrap_schema(obj["description"])
         # properties wrapper
         if "properties" in obj and isinstance(obj["properties"], dict):
             obj = obj["properties"]
-        return {k: _unwrap_schema(v) for k, v in obj.items()}
+        # leaves are copied as-is without a recursive call
+        return {
+            k: _unwrap_schema(v) if isinstance(v, (dict, list)) else v
+            for k, v in obj.items()
+        }
     return obj
 
 def _repair_schema(obj: Any, defaults: dict = None) -> Any:
@@ -258,14 +492,15 @@ def _repair_schema(obj: Any, defaults: dict = None) -> Any:
         return [_repair_schema(i, defaults) for i in obj]
     if isinstance(obj, dict):
         # Unwrap {description: {...}} or {type, description: ...}
-        if set(obj.keys()) == {"description"} and isinstance(obj["description"], dict):
+        if len(obj) == 1 and "description" in obj and isinstance(obj["description"], dict):
             return _repair_schema(obj["description"], defaults)
-        if set(obj.keys()) >= {"type", "description"} and isinstance(obj["description"], str):
+        if "type" in obj and "description" in obj and isinstance(obj["description"], str):
             return obj["description"]
         # Inject defaults for missing required fields
         result = {}
         for k, v in obj.items():
-            result[k] = _repair_schema(v, defaults.get(k, {}))
+            # leaves are copied as-is without a recursive call
+            result[k] = _repair_schema(v, defaults.get(k)) if isinstance(v, (dict, list)) else v
         for k, v in defaults.items():
             if k not in result:
                 result[k] = v
@@ -298,6 +533,9 @@ class MultiLLMService:
     
     # Default number of retries for JSON parsing in structured output
     DEFAULT_JSON_PARSE_RETRIES = int(os.getenv("MULTI_LLM_JSON_PARSE_RETRIES", "3"))
+    
+    # Maximum number of attachments processed at the same time per request
+    MAX_CONCURRENT_ATTACHMENTS = int(os.getenv("MULTI_LLM_MAX_CONCURRENT_ATTACHMENTS", "4"))
 
     def __init__(
         self,
@@ -319,8 +557,7 @@ class MultiLLMService:
         if neo4j_driver and MessageManager:
             self.message_manager = MessageManager(neo4j_driver)
 
-        # propagate env vars for litellm
-        self._prepare_env()
+        # litellm reads provider keys and API bases from os.environ itself
         litellm.modify_params = True  # needed for Anthropic tool calling quirk
 
         # Streaming infinite loop protection
@@ -338,12 +575,15 @@ class MultiLLMService:
     # ------------------------------------------------------------------
     # 🗣️  P U B L I C   A P I
     # ------------------------------------------------------------------
+    async def close(self) -> None:
+        """Release pooled connections held on behalf of the service."""
+        await close_http_client()
+
     def set_model(self, model: str) -> None:
         """
         Update the current model and refresh any dependent state.
         """
         self.model = model
-        self._prepare_env()
         # Optionally clear model-specific caches if needed
 
     def _filter_supported_kwargs(self, model: str, kw: dict) -> dict:
@@ -353,24 +593,23 @@ class MultiLLMService:
         """
         if len(kw) == 0:
             return kw
-        params_from_litellm = litellm.get_supported_openai_params(model)
-        if params_from_litellm is None:
+        params = _supported_params_for(model)
+        if params is None:
             logger.warning(f"Could not determine supported params for model '{model}'. Returning unfiltered.")
             return kw  # No filtering if we can't determine params
         
-        params = set(params_from_litellm) if params_from_litellm else set()
-        # Always allow 'api_base', 'api_key', 'api_version' for custom endpoints
-        params.update({"api_base", "api_key", "api_version"})
         filtered = {k: v for k, v in kw.items() if k in params}
-        removed = {k: v for k, v in kw.items() if k not in params}
-        if removed:
+        # Equal lengths mean nothing was removed; skip building the removed dict
+        if len(filtered) != len(kw):
+            removed = {k: v for k, v in kw.items() if k not in params}
             logger.warning(f"Filtered out unsupported kwargs for model '{model}': {removed}")
         return filtered
 
-    async def chat_completion(
+    def chat_completion(
         self,
         messages: List[litellm.Message],
         *,
+        model: Optional[str] = None,
         persistence: bool = False,
         session_id: Optional[str] = None,
         system_prompt: Optional[str] = None,
@@ -380,11 +619,87 @@ class MultiLLMService:
         temperature: float = 0.7,
         max_tokens: int = 8192,
         attachments: Optional[List[str]] = None,
+        raw_sse: bool = False,
         **kw: Any,
     ) -> AsyncGenerator:
         """
         Always returns an async generator that yields response chunks as they arrive.
         All responses are streamed; non-streaming logic is removed.
+        
+        With ``raw_sse=True`` each chunk is yielded already serialized as the
+        JSON text of an SSE data field, so callers can forward it unchanged.
+        
+        ``model`` selects the model for this call only, falling back to the
+        service default, so concurrent requests never share model state.
+        """
+        model = model or self.model
+        return self._chat_completion_prepared(
+            messages,
+            model=model,
+            sys_prompt=self._augment_system_prompt(system_prompt or "", tools_prompt, tools),
+            tools_spec=self._format_tools(tools) if tools else None,
+            filtered_kw=self._filter_supported_kwargs(model, kw),
+            persistence=persistence,
+            session_id=session_id,
+            tool_manager=tool_manager,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            attachments=attachments,
+            raw_sse=raw_sse,
+        )
+
+    def _chat_completion_prepared(
+        self,
+        messages: List[litellm.Message],
+        *,
+        model: str,
+        sys_prompt: str,
+        tools_spec: Optional[List[Dict[str, Any]]],
+        filtered_kw: Dict[str, Any],
+        persistence: bool = False,
+        session_id: Optional[str] = None,
+        tool_manager: Optional["ToolManagerProtocol"] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 8192,
+        attachments: Optional[List[str]] = None,
+        raw_sse: bool = False,
+    ) -> AsyncGenerator:
+        """
+        ``chat_completion`` with the system prompt, tools spec and filtered
+        kwargs already computed, so repeated calls (e.g. structured-output
+        retries) build them only once.
+
+        Plain chat (no tools and no tool manager) is streamed by a generator
+        without the tool orchestration machinery, chosen once per call.
+        """
+        stream = self._stream_plain if tool_manager is None and not tools_spec else self._stream_with_tools
+        return stream(
+            messages,
+            model=model,
+            sys_prompt=sys_prompt,
+            tools_spec=tools_spec,
+            filtered_kw=filtered_kw,
+            persistence=persistence,
+            session_id=session_id,
+            tool_manager=tool_manager,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            attachments=attachments,
+            raw_sse=raw_sse,
+        )
+
+    async def _prepare_messages(
+        self,
+        messages: List[litellm.Message],
+        *,
+        sys_prompt: str,
+        persistence: bool,
+        session_id: Optional[str],
+        attachments: Optional[List[str]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Validate the call, load history and assemble (and persist) the new
+        system, user and attachment messages into the list sent to the LLM.
         """
         if persistence and not session_id:
             raise ValueError("session_id required when persistence=True")
@@ -400,7 +715,6 @@ class MultiLLMService:
 
         # Message Assembly & Persistence
         current_messages = []
-        sys_prompt = self._augment_system_prompt(system_prompt or "", tools_prompt, tools)
         if sys_prompt and (not conversation_history or conversation_history[0].get("role") != "system"):
             current_messages.append({"role": "system", "content": sys_prompt})
             if persistence:
@@ -425,13 +739,16 @@ class MultiLLMService:
             import inspect
             from mcp_tools.tools.qdrant.qdrant_ingest.document_processor import DocumentProcessor
             processor = DocumentProcessor()
-            for path in attachments:
-                try:
-                    file_info = None
-                    if inspect.iscoroutinefunction(processor.process_file):
+            process_async = inspect.iscoroutinefunction(processor.process_file)
+            attachment_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_ATTACHMENTS)
+
+            async def _process_one_attachment(path: str) -> Dict[str, Any]:
+                async with attachment_semaphore:
+                    if process_async:
                         file_info = await processor.process_file(path)
                     else:
-                        file_info = processor.process_file(path)
+                        # Sync processors run in a thread so files overlap
+                        file_info = await asyncio.to_thread(processor.process_file, path)
                     # Audio fallback: if audio and no transcript, try Whisper
                     if file_info and file_info.get("type") == "audio" and not file_info.get("transcript"):
                         try:
@@ -441,21 +758,121 @@ class MultiLLMService:
                                 file_info["summary"] = f"[Transcribed audio]: {transcript[:200]}"
                         except Exception as e:
                             logger.warning(f"Audio fallback transcription failed for {path}: {e}")
-                    attach_msg = {
+                    return {
                         "role": "user",
                         "content": f"[ATTACHMENT: {os.path.basename(path)}]\n{file_info.get('summary','')}"
                     }
-                    current_messages.append(attach_msg)
-                    if persistence:
+
+            # Process files concurrently; results keep the attachment order
+            results = await asyncio.gather(
+                *(_process_one_attachment(path) for path in attachments),
+                return_exceptions=True
+            )
+            for path, attach_msg in zip(attachments, results):
+                if isinstance(attach_msg, Exception):
+                    logger.warning(f"Attachment processing failed for {path}: {attach_msg}")
+                    continue
+                current_messages.append(attach_msg)
+                if persistence:
+                    try:
                         await self.message_manager.add_user_message(session_id, attach_msg["content"])
-                except Exception as e:
-                    logger.warning(f"Attachment processing failed for {path}: {e}")
+                    except Exception as e:
+                        logger.warning(f"Attachment processing failed for {path}: {e}")
 
-        # Combine with history
-        full_conversation = conversation_history + current_messages
-        tools_spec = self._format_tools(tools) if tools else None
+        # Combine with history into the one list the orchestration loop appends to
+        current_msgs = []
+        current_msgs.extend(conversation_history)
+        current_msgs.extend(current_messages)
+        return current_msgs
+
+    async def _stream_plain(
+        self,
+        messages: List[litellm.Message],
+        *,
+        model: str,
+        sys_prompt: str,
+        tools_spec: Optional[List[Dict[str, Any]]],
+        filtered_kw: Dict[str, Any],
+        persistence: bool = False,
+        session_id: Optional[str] = None,
+        tool_manager: Optional["ToolManagerProtocol"] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 8192,
+        attachments: Optional[List[str]] = None,
+        raw_sse: bool = False,
+    ) -> AsyncGenerator:
+        """
+        Stream a single completion with no tools: each chunk only carries
+        content, and the first finish reason ends the stream.
+        """
+        current_msgs = await self._prepare_messages(
+            messages,
+            sys_prompt=sys_prompt,
+            persistence=persistence,
+            session_id=session_id,
+            attachments=attachments,
+        )
+
+        async with self.semaphore:
+            logger.debug("Semaphore acquired")
+            assistant_buffer = []
+            resp_stream = await self._acompletion(
+                model=model,
+                messages=current_msgs,
+                tools=None,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **filtered_kw,
+            )
+            async for chunk in resp_stream:
+                choices = getattr(chunk, "choices", None)
+                if not choices:
+                    continue
+                choice = choices[0]
+                content = getattr(choice.delta, "content", None)
+                if content:
+                    assistant_buffer.append(content)
+                    if raw_sse:
+                        yield _encode_sse_content(content)
+                    else:
+                        yield {"type": "content", "content": content}
+                if getattr(choice, "finish_reason", None):
+                    break
+            # Persist final assistant message
+            final_content = "".join(assistant_buffer)
+            if persistence and final_content:
+                await self.message_manager.add_assistant_message(session_id, final_content)
+            event = {"type": "complete", "content": final_content}
+            yield _encode_sse_event(event) if raw_sse else event
 
-        filtered_kw = self._filter_supported_kwargs(self.model, kw)
+    async def _stream_with_tools(
+        self,
+        messages: List[litellm.Message],
+        *,
+        model: str,
+        sys_prompt: str,
+        tools_spec: Optional[List[Dict[str, Any]]],
+        filtered_kw: Dict[str, Any],
+        persistence: bool = False,
+        session_id: Optional[str] = None,
+        tool_manager: Optional["ToolManagerProtocol"] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 8192,
+        attachments: Optional[List[str]] = None,
+        raw_sse: bool = False,
+    ) -> AsyncGenerator:
+        """
+        Stream completions, executing requested tools and calling the LLM
+        again with their results until it stops asking for tools.
+        """
+        current_msgs = await self._prepare_messages(
+            messages,
+            sys_prompt=sys_prompt,
+            persistence=persistence,
+            session_id=session_id,
+            attachments=attachments,
+        )
 
         # Streaming LLM Call with Integrated Orchestration
         async with self.semaphore:
@@ -463,12 +880,11 @@ class MultiLLMService:
             assistant_buffer = []
             iteration = 0
             max_iterations = 10
-            current_msgs = full_conversation.copy()
             should_continue = True
             while iteration < max_iterations and should_continue:
                 iteration += 1
                 completion_kwargs = {
-                    "model": self.model,
+                    "model": model,
                     "messages": current_msgs,
                     "tools": tools_spec,
                     "temperature": temperature,
@@ -482,81 +898,119 @@ class MultiLLMService:
                 last_tool_id = None
                 # Streaming loop
                 async for chunk in resp_stream:
-                    if hasattr(chunk, "choices") and chunk.choices:
-                        delta = chunk.choices[0].delta
-                        # Check for finish_reason
-                        if hasattr(chunk.choices[0], "finish_reason") and chunk.choices[0].finish_reason:
-                            finish_reason = chunk.choices[0].finish_reason
-                        # Content streaming
-                        if getattr(delta, "content", None):
-                            assistant_buffer.append(delta.content)
-                            yield {"type": "content", "content": delta.content}
-                        # Tool-call streaming (buffered)
-                        if getattr(delta, "tool_calls", None) and tool_manager:
-                            for tc in delta.tool_calls:
-                                tc_id = getattr(tc, "id", None)
-                                tc_name = getattr(tc.function, "name", None) if hasattr(tc, "function") else None
-                                tc_args = getattr(tc.function, "arguments", None) if hasattr(tc, "function") else None
-                                # New tool call (has both id and name)
-                                if tc_id and tc_name:
-                                    tool_buffers[tc_id] = {"name": tc_name, "args": ""}
-                                    last_tool_id = tc_id
-                                    active_tool_ids.add(tc_id)
-                                # Arguments for specific tool (has id but no name)
-                                elif tc_id and tc_id in tool_buffers and tc_args:
-                                    tool_buffers[tc_id]["args"] += tc_args
-                                # Continuation of existing tool (only arguments, no id/name)
-                                elif tc_args and last_tool_id and last_tool_id in tool_buffers:
-                                    tool_buffers[last_tool_id]["args"] += tc_args
-                                # Fallback: append to most recent tool if we have args but no clear target
-                                elif tc_args and last_tool_id:
-                                    if last_tool_id not in tool_buffers:
-                                        tool_buffers[last_tool_id] = {"name": "unknown", "args": ""}
-                                        active_tool_ids.add(last_tool_id)
-                                    tool_buffers[last_tool_id]["args"] += tc_args
+                    # Chunk fields are read once into locals; most chunks
+                    # carry only content, so that path is attribute-light
+                    choices = getattr(chunk, "choices", None)
+                    if not choices:
+                        continue
+                    choice = choices[0]
+                    delta = choice.delta
+                    try:
+                        content = delta.content
+                        delta_tool_calls = delta.tool_calls
+                    except AttributeError:
+                        # Partial deltas (e.g. from mock providers) may omit fields
+                        content = getattr(delta, "content", None)
+                        delta_tool_calls = getattr(delta, "tool_calls", None)
+                    finish_reason = getattr(choice, "finish_reason", None)
+                    # Content streaming
+                    if content:
+                        assistant_buffer.append(content)
+                        if raw_sse:
+                            yield _encode_sse_content(content)
+                        else:
+                            yield {"type": "content", "content": content}
+                    # Tool-call streaming (buffered)
+                    if delta_tool_calls and tool_manager:
+                        for tc in delta_tool_calls:
+                            tc_id = getattr(tc, "id", None)
+                            function = getattr(tc, "function", None)
+                            if function is not None:
+                                tc_name = getattr(function, "name", None)
+                                tc_args = getattr(function, "arguments", None)
+                            else:
+                                tc_name = tc_args = None
+                            # Dispatch on which of id/name/arguments the delta carries
+                            handler = _TOOL_CALL_DELTA_HANDLERS.get(
+                                (1 if tc_id else 0) | (2 if tc_name else 0) | (4 if tc_args else 0)
+                            )
+                            if handler is not None:
+                                last_tool_id = handler(
+                                    tool_buffers, active_tool_ids, last_tool_id, tc_id, tc_name, tc_args
+                                )
                     # Process completed tool calls on finish_reason
-                    if hasattr(chunk, "choices") and chunk.choices and chunk.choices[0].finish_reason in ("tool_calls", "stop"):
+                    if finish_reason in ("tool_calls", "stop"):
                         
-                        # Check if there are any active tool calls to process
-                        tool_calls_processed = False
-                        for tool_id in list(active_tool_ids):
+                        # Collect the completed tool calls in the order the model
+                        # emitted them, parsing their arguments
+                        pending = []
+                        for tool_id in [t for t in tool_buffers if t in active_tool_ids]:
                             buf = tool_buffers.pop(tool_id, None)
+                            active_tool_ids.remove(tool_id)
                             if buf:
-                                tool_calls_processed = True
                                 try:
-                                    args = json.loads(buf["args"] or "{}")
-                                    # Add assistant tool call message
-                                    tool_call_msg = {
-                                        "role": "assistant",
-                                        "tool_calls": [{
-                                            "id": tool_id,
-                                            "type": "function",
-                                            "function": {"name": buf["name"], "arguments": json.dumps(args)}
-                                        }]
-                                    }
-                                    current_msgs.append(tool_call_msg)
-                                    # Execute tool and add to conversation
-                                    result = await tool_manager.execute_tool(buf["name"], args)
-                                    tool_result_msg = {
-                                        "role": "tool",
-                                        "name": buf["name"],
-                                        "content": result,
-                                        "tool_call_id": tool_id
-                                    }
-                                    current_msgs.append(tool_result_msg)
-                                    if persistence:
-                                        await self.message_manager.add_tool_message(
-                                            session_id, result, buf["name"], tool_id
-                                        )
-                                    yield {"type": "tool_result", "name": buf["name"], "result": result}
+                                    pending.append((tool_id, buf["name"], orjson.loads(buf["args"]) if buf["args"] else {}, None))
                                 except Exception as err:
-                                    error_msg = {"role": "tool", "content": f"Error: {str(err)}", "tool_call_id": tool_id}
-                                    current_msgs.append(error_msg)
-                                    yield {"type": "tool_error", "error": str(err)}
-                                active_tool_ids.remove(tool_id)
+                                    pending.append((tool_id, buf["name"], None, err))
+                        tool_calls_processed = bool(pending)
+                        
+                        # Execute independent tools concurrently; results come
+                        # back in call order
+                        outcomes = await asyncio.gather(
+                            *(
+                                self._execute_tool_call(tool_manager, name, args)
+                                for _, name, args, parse_error in pending
+                                if parse_error is None
+                            ),
+                            return_exceptions=True
+                        )
+                        outcomes_iter = iter(outcomes)
+                        tool_results_to_persist = []
+                        
+                        for tool_id, name, args, parse_error in pending:
+                            try:
+                                if parse_error is not None:
+                                    raise parse_error
+                                # Add assistant tool call message
+                                tool_call_msg = {
+                                    "role": "assistant",
+                                    "tool_calls": [{
+                                        "id": tool_id,
+                                        "type": "function",
+                                        "function": {"name": name, "arguments": orjson.dumps(args).decode()}
+                                    }]
+                                }
+                                current_msgs.append(tool_call_msg)
+                                outcome = next(outcomes_iter)
+                                if isinstance(outcome, BaseException):
+                                    raise outcome
+                                result, raw_result = outcome
+                                tool_result_msg = {
+                                    "role": "tool",
+                                    "name": name,
+                                    "content": result,
+                                    "tool_call_id": tool_id
+                                }
+                                current_msgs.append(tool_result_msg)
+                                if persistence:
+                                    tool_results_to_persist.append(tool_result_msg)
+                                if raw_result is not None and raw_sse:
+                                    yield _encode_sse_tool_result(name, result)
+                                else:
+                                    if raw_result is not None:
+                                        result = orjson.loads(raw_result)
+                                    yield {"type": "tool_result", "name": name, "result": result}
+                            except Exception as err:
+                                error_msg = {"role": "tool", "content": f"Error: {str(err)}", "tool_call_id": tool_id}
+                                current_msgs.append(error_msg)
+                                event = {"type": "tool_error", "error": str(err)}
+                                yield _encode_sse_event(event) if raw_sse else event
+                        
+                        if tool_results_to_persist:
+                            await self._persist_tool_results(session_id, tool_results_to_persist)
                         
                         # Decide whether to continue or break based on whether tool calls were processed
-                        if tool_calls_processed or chunk.choices[0].finish_reason == "tool_calls":
+                        if tool_calls_processed or finish_reason == "tool_calls":
                             # Either we processed tool calls or the finish reason explicitly indicates tool calls
                             break
                         else:
@@ -571,7 +1025,8 @@ class MultiLLMService:
             final_content = "".join(assistant_buffer)
             if persistence and final_content:
                 await self.message_manager.add_assistant_message(session_id, final_content)
-            yield {"type": "complete", "content": final_content}
+            event = {"type": "complete", "content": final_content}
+            yield _encode_sse_event(event) if raw_sse else event
 
     async def chat_completion_structured(
         self,
@@ -604,9 +1059,6 @@ class MultiLLMService:
         Raises:
             ValueError: If JSON parsing fails after all retry attempts
         """
-        import json
-        import re
-        
         # Use default if not specified
         if max_retries is None:
             max_retries = self.DEFAULT_JSON_PARSE_RETRIES
@@ -628,33 +1080,40 @@ class MultiLLMService:
         # Keep track of messages for retries        
         retry_messages = messages.copy()
         
+        # Set-up that is identical for every attempt is done once
+        model = self.model
+        sys_prompt = self._augment_system_prompt(system_prompt or "", tools_prompt, tools)
+        tools_spec = self._format_tools(tools) if tools else None
+        filtered_kw = self._filter_supported_kwargs(model, kw)
+        schema_text = None
+        
         for attempt in range(max_retries):
-            # Collect all chunks from streaming response
-            content_chunks = []
+            # Collect all chunks from streaming response into one buffer
+            content_buffer = io.StringIO()
             complete_content = ""
             
-            async for chunk in self.chat_completion(
+            async for chunk in self._chat_completion_prepared(
                 retry_messages,
+                model=model,
+                sys_prompt=sys_prompt,
+                tools_spec=tools_spec,
+                filtered_kw=filtered_kw,
                 persistence=persistence,
                 session_id=session_id,
-                system_prompt=system_prompt,
-                tools_prompt=tools_prompt,
-                tools=tools,
                 tool_manager=tool_manager,
                 temperature=temperature,
                 max_tokens=max_tokens,
                 attachments=attachments,
-                **kw,
             ):
                 if isinstance(chunk, dict):
                     if chunk.get("type") == "content":
-                        content_chunks.append(chunk.get("content", ""))
+                        content_buffer.write(chunk.get("content", ""))
                     elif chunk.get("type") == "complete":
                         # Use complete content if available
                         complete_content = chunk.get("content", "")
             
             # Get the final content
-            result_text = complete_content if complete_content else "".join(content_chunks)
+            result_text = complete_content if complete_content else content_buffer.getvalue()
             
             # Try to extract JSON
             result = self._extract_json_with_validation(result_text, response_format)
@@ -674,7 +1133,10 @@ class MultiLLMService:
                 })
                 
                 # Add error message asking for correct format
-                error_msg = self._create_json_retry_message(result_text, response_format)
+                if response_format and schema_text is None:
+                    # Serialized once, on the first retry that needs it
+                    schema_text = orjson.dumps(response_format, option=orjson.OPT_INDENT_2).decode()
+                error_msg = self._create_json_retry_message(result_text, response_format, schema_text)
                 retry_messages.append({
                     "role": "user",
                     "content": error_msg
@@ -700,61 +1162,64 @@ class MultiLLMService:
         # For now, just return the result if we successfully parsed something
         return result if result else None
     
-    def _create_json_retry_message(self, failed_response: str, response_format: Optional[Any] = None) -> str:
+    def _create_json_retry_message(
+        self,
+        failed_response: str,
+        response_format: Optional[Any] = None,
+        schema_text: Optional[str] = None,
+    ) -> str:
         """
         Create a retry message explaining the JSON parsing error and requesting correct format.
-        """
-        import json
         
-        error_msg = "Your previous response could not be parsed as valid JSON. "
+        ``schema_text`` is ``response_format`` already pretty-printed, so
+        repeated retries don't serialize the schema again.
+        """
+        parts = ["Your previous response could not be parsed as valid JSON. "]
         
         # Try to identify the specific parsing error
         try:
-            json.loads(failed_response)
-        except json.JSONDecodeError as e:
-            error_msg += f"JSON parsing error: {str(e)}. "
+            orjson.loads(failed_response)
+        except orjson.JSONDecodeError as e:
+            parts.append(f"JSON parsing error: {str(e)}. ")
         
-        error_msg += "\n\nPlease provide your response as valid JSON. "
+        parts.append("\n\nPlease provide your response as valid JSON. ")
         
         if response_format:
-            error_msg += f"The expected format is:\n{json.dumps(response_format, indent=2)}\n\n"
+            if schema_text is None:
+                schema_text = orjson.dumps(response_format, option=orjson.OPT_INDENT_2).decode()
+            parts.append(f"The expected format is:\n{schema_text}\n\n")
         
-        error_msg += "Make sure to:\n"
-        error_msg += "1. Use proper JSON syntax with double quotes for strings\n"
-        error_msg += "2. Ensure all brackets and braces are properly closed\n"
-        error_msg += "3. Avoid trailing commas\n"
-        error_msg += "4. Return ONLY the JSON object, without any additional text or markdown formatting"
+        parts.append(_JSON_RETRY_INSTRUCTIONS)
         
-        return error_msg
+        return "".join(parts)
     
     def _extract_json(self, text: str) -> Dict[str, Any]:
         """Extract JSON from text with multiple fallback strategies."""
-        import json
-        import re
-        
         if not text:
             return {}
         
         # First, try parsing the raw text
         try:
-            return json.loads(text)
-        except json.JSONDecodeError:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
             pass
         
         # Try to extract JSON from markdown code blocks
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\}|\[.*?\])\s*```', text, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(1))
-            except json.JSONDecodeError:
-                pass
+        bounds = _md_fence_bounds(text)
+        if bounds:
+            candidate = _find_json_span(text, *bounds)
+            if candidate:
+                try:
+                    return orjson.loads(candidate)
+                except orjson.JSONDecodeError:
+                    pass
         
         # Try to find JSON object or array in the text
-        json_match = re.search(r'(\{.*\}|\[.*\])', text, re.DOTALL)
-        if json_match:
+        candidate = _find_json_span(text)
+        if candidate:
             try:
-                return json.loads(json_match.group(1))
-            except json.JSONDecodeError:
+                return orjson.loads(candidate)
+            except orjson.JSONDecodeError:
                 pass
         
         # If all parsing attempts fail, log warning and return empty dict
@@ -769,6 +1234,40 @@ class MultiLLMService:
     # ------------------------------------------------------------------
     # 🛠️  H E L P E R S
     # ------------------------------------------------------------------
+    @staticmethod
+    async def _execute_tool_call(
+        tool_manager: "ToolManagerProtocol", name: str, args: Dict[str, Any]
+    ) -> Tuple[Any, Optional[bytes]]:
+        """
+        Execute one tool call, returning ``(result, raw_result)``.
+
+        Raw JSON results are returned as text alongside the original bytes so
+        they can be forwarded without a decode/encode round trip.
+        """
+        if hasattr(tool_manager, "execute_tool_raw"):
+            raw_result = await tool_manager.execute_tool_raw(name, args)
+            return raw_result.decode(), raw_result
+        return await tool_manager.execute_tool(name, args), None
+
+    async def _persist_tool_results(
+        self, session_id: str, tool_results: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Persist one round's tool results, in a single write when the message
+        manager supports bulk inserts.
+        """
+        add_bulk = getattr(self.message_manager, "add_messages_bulk", None)
+        try:
+            if add_bulk is not None:
+                await add_bulk(session_id, tool_results)
+                return
+            for msg in tool_results:
+                await self.message_manager.add_tool_message(
+                    session_id, msg["content"], msg["name"], msg["tool_call_id"]
+                )
+        except Exception as e:
+            logger.warning(f"Could not persist tool results for session {session_id}: {e}")
+
     @staticmethod
     def _format_tools(tools: List[Tool]) -> List[Dict[str, Any]]:
         return [
@@ -787,20 +1286,30 @@ class MultiLLMService:
     # 💾  PERSISTENT CHAT API
     # ------------------------------------------------------------------
     # [REMOVED: chat_completion_with_persistence and all duplicate persistence logic per refactor instructions]
-    def _prepare_env(self):
-        """Propagate provider‑specific env vars for litellm to pick up."""
-        env_map = {
-            "openai": ("OPENAI_API_KEY", "OPENAI_API_BASE"),
-            "anthropic": ("ANTHROPIC_API_KEY", "ANTHROPIC_API_BASE"),
-            "ollama": ("OLLAMA_API_KEY", "OLLAMA_API_BASE"),
-            "lm_studio": ("LM_STUDIO_API_KEY", "LM_STUDIO_API_BASE"),
-        }
-        for provider, (key_var, base_var) in env_map.items():
-            # Robust: set env var if not present
-            if not os.environ.get(key_var) and os.getenv(key_var):
-                os.environ[key_var] = os.getenv(key_var)
-            if not os.environ.get(base_var) and os.getenv(base_var):
-                os.environ[base_var] = os.getenv(base_var)
+    async def persist_reply(
+        self,
+        messages: List[litellm.Message],
+        reply: str,
+        *,
+        session_id: str,
+        system_prompt: Optional[str] = None,
+        tools_prompt: Optional[str] = None,
+        tools: Optional[List[Tool]] = None,
+    ) -> Optional[str]:
+        """
+        Persist a turn answered without calling the LLM, e.g. from a cache.
+
+        The system, user and assistant messages are written exactly as
+        ``chat_completion(persistence=True)`` writes them.
+        """
+        await self._prepare_messages(
+            messages,
+            sys_prompt=self._augment_system_prompt(system_prompt or "", tools_prompt, tools),
+            persistence=True,
+            session_id=session_id,
+            attachments=None,
+        )
+        return await self.message_manager.add_assistant_message(session_id, reply)
 
     def _add_to_cache(self, key: str, value: Any):
         _llm_response_cache[key] = value
@@ -810,39 +1319,30 @@ class MultiLLMService:
             _llm_response_cache.pop(oldest, None)
 
     def _supports_response_format(self, model: str) -> bool:
-        # Check if model supports response_format (OpenAI, not e.g. LM Studio)
-        try:
-            params = litellm.get_supported_openai_params(model)
-            return "response_format" in params or model.startswith("lm_studio")
-        except Exception:
-            return False
+        return _supports_response_format_cached(model)
 
     def _supports_tool_calling(self, model: str) -> bool:
-        # Check if model supports tool-calling
-        try:
-            return litellm.supports_function_calling(model) or model.startswith("lm_studio")
-        except Exception:
-            return False
+        return _supports_tool_calling_cached(model)
 
     def supports_reasoning(self) -> bool:
         # Expose reasoning support check
-        return hasattr(litellm, "supports_reasoning") and litellm.supports_reasoning(self.model)
+        return _supports_reasoning_cached(self.model)
 
     def _augment_system_prompt(self, sys_prompt: str, tools_prompt: Optional[str], tools: Optional[List[Tool]]) -> str:
         # Always append current date/time and merge tool prompt if tools present
-        now = time.strftime("%Y-%m-%d %H:%M:%S")
-        prompt = sys_prompt.strip()
+        now = _current_datetime_text()
+        parts = [sys_prompt.strip()]
         if tools_prompt:
-            prompt += "\n" + tools_prompt.strip()
+            parts.append(tools_prompt.strip())
         if tools:
-            prompt += "\n[Tool-calling enabled]"
-        prompt += f"\nCurrent date/time: {now}"
-        return prompt
+            parts.append("[Tool-calling enabled]")
+        parts.append(f"Current date/time: {now}")
+        return "\n".join(parts)
 
     def _looks_like_tool_call_json(self, text: str) -> bool:
         # Detect custom tool-call JSON or GPT-4o action/arguments pattern
         try:
-            obj = json.loads(_strip_md_json(text))
+            obj = orjson.loads(_strip_md_json(text))
             if "tool_calls" in obj:
                 return True
             # GPT-4o: {"action": ..., "arguments": {...}}
@@ -861,9 +1361,9 @@ class MultiLLMService:
     def _convert_tool_call_json(self, text: str) -> str:
         # Convert custom tool-call JSON or GPT-4o action/arguments to OpenAI format
         try:
-            obj = json.loads(_strip_md_json(text))
+            obj = orjson.loads(_strip_md_json(text))
             if "tool_calls" in obj:
-                return json.dumps(obj["tool_calls"])
+                return orjson.dumps(obj["tool_calls"]).decode()
             # GPT-4o: {"action": ..., "arguments": {...}}
             if (
                 isinstance(obj, dict)
@@ -873,16 +1373,16 @@ class MultiLLMService:
                 and isinstance(obj["arguments"], dict)
             ):
                 # Synthesize OpenAI-style tool_call
-                return json.dumps([
+                return orjson.dumps([
                     {
                         "id": "synthetic",
                         "type": "function",
                         "function": {
                             "name": obj["action"],
-                            "arguments": json.dumps(obj["arguments"]),
+                            "arguments": orjson.dumps(obj["arguments"]).decode(),
                         },
                     }
-                ])
+                ]).decode()
         except Exception:
             pass
         return text
@@ -983,3 +1483,16 @@ def create_continue_message() -> Dict[str, Any]:
 def _looks_like_json(text: str) -> bool:
     text = text.strip()
     return text.startswith("{") and text.endswith("}")
+
+# Last formatted timestamp as (epoch second, text); reused within a second
+_now_text: Tuple[int, str] = (-1, "")
+
+def _current_datetime_text() -> str:
+    """Local time as ``YYYY-mm-dd HH:MM:SS``, formatted at most once a second."""
+    global _now_text
+    now = int(time.time())
+    cached_at, text = _now_text
+    if now != cached_at:
+        text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        _now_text = (now, text)
+    return text
@@ -0,0 +1,185 @@
+"""
+Semantic Cache for LLM Proxy Service
+
+In-process cache that answers repeated or near-identical informational prompts
+from previous LLM responses using embedding similarity.
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Messages that ask the assistant to *do* something must always reach the LLM
+# (and its tools); only informational requests are eligible for caching.
+_COMMAND_RE = re.compile(
+    r"\b(?:send|delete|post|create|remove|update|schedule|execute|run)\b",
+    re.IGNORECASE,
+)
+
+
+class SemanticCache:
+    """Embedding-similarity cache for non-streaming chat completions.
+
+    Responses are scoped to one session, its ``history_size`` newest messages
+    and the sampling temperature, so one session's answers are never served
+    to another, and expire after ``ttl`` seconds since they may reflect live
+    tool results.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        threshold: float = 0.95,
+        max_entries: int = 1000,
+        ttl: float = 300.0,
+        max_contexts: int = 1000,
+        history_size: int = 4,
+    ):
+        """Initialize the semantic cache.
+
+        Args:
+            model_name: fastembed model used to embed prompts
+            threshold: Minimum cosine similarity for a cache hit
+            max_entries: Maximum cached responses per context before FIFO eviction
+            ttl: Seconds a cached response stays valid
+            max_contexts: Maximum number of contexts kept, least recently used evicted
+            history_size: Number of a session's newest messages in its context key
+        """
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_contexts = max_contexts
+        self.history_size = history_size
+
+        # context key -> (FAISS index, cached (response content, stored at) pairs)
+        self._indexes: "OrderedDict[str, Tuple[Any, List[Tuple[str, float]]]]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._embedder = None
+        self.enabled = True
+
+        try:
+            import faiss  # noqa: F401
+            import numpy  # noqa: F401
+            from fastembed import TextEmbedding
+
+            self._embedder = TextEmbedding(model_name)
+            logger.info(f"Semantic cache enabled with model {model_name}")
+        except Exception as e:
+            logger.warning(f"Semantic cache disabled, embedding backend unavailable: {e}")
+            self.enabled = False
+
+    @staticmethod
+    def is_cacheable(message: str) -> bool:
+        """Return True if the message is informational rather than a command."""
+        return not _COMMAND_RE.search(message)
+
+    @staticmethod
+    def context_key(
+        model: str,
+        system_prompt: str,
+        tools_prompt: str,
+        tools_description: str,
+        session_id: str,
+        temperature: float,
+        recent: Iterable[Dict[str, Any]] = (),
+    ) -> str:
+        """Build the key that scopes cached responses to one session's prompt context.
+
+        ``recent`` is the session's newest messages (at most ``history_size``),
+        so the key costs the same however long the session grows.
+        """
+        digest = hashlib.sha256()
+        for part in (model, system_prompt, tools_prompt, tools_description, session_id, repr(temperature)):
+            digest.update((part or "").encode())
+            digest.update(b"\0")
+        for message in recent:
+            for part in (message.get("id"), message.get("role"), message.get("content")):
+                digest.update(str(part or "").encode())
+                digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def embed(self, message: str):
+        """Embed a message once so ``lookup`` and ``store`` can share the vector."""
+        if not self.enabled:
+            return None
+        return await asyncio.to_thread(self._embed, message)
+
+    async def lookup(self, vector, context_key: str) -> Optional[str]:
+        """Return a cached response for a semantically equivalent message, if any."""
+        if not self.enabled or vector is None:
+            return None
+
+        async with self._lock:
+            entry = self._indexes.get(context_key)
+            if entry is None:
+                return None
+            self._indexes.move_to_end(context_key)
+            index, contents = entry
+            self._evict_expired(index, contents)
+            if index.ntotal == 0:
+                return None
+            scores, ids = index.search(vector, 1)
+            if ids[0][0] < 0 or scores[0][0] < self.threshold:
+                return None
+            content, _ = contents[ids[0][0]]
+
+        logger.info(f"Semantic cache hit (similarity {scores[0][0]:.3f})")
+        return content
+
+    async def store(self, vector, context_key: str, content: str) -> None:
+        """Cache an LLM response for the embedded message and context."""
+        if not self.enabled or vector is None:
+            return
+
+        async with self._lock:
+            entry = self._indexes.get(context_key)
+            if entry is None:
+                import faiss
+                entry = (faiss.IndexFlatIP(vector.shape[1]), [])
+                self._indexes[context_key] = entry
+                if len(self._indexes) > self.max_contexts:
+                    self._indexes.popitem(last=False)
+            else:
+                self._indexes.move_to_end(context_key)
+
+            index, contents = entry
+            self._evict_expired(index, contents)
+            if index.ntotal >= self.max_entries:
+                self._evict_oldest(index, contents, 1)
+
+            index.add(vector)
+            contents.append((content, time.monotonic()))
+
+    def _evict_expired(self, index, contents: List[Tuple[str, float]]) -> None:
+        """Drop entries older than the TTL; entries are kept oldest first."""
+        cutoff = time.monotonic() - self.ttl
+        count = 0
+        while count < len(contents) and contents[count][1] < cutoff:
+            count += 1
+        if count:
+            self._evict_oldest(index, contents, count)
+
+    @staticmethod
+    def _evict_oldest(index, contents: List[Tuple[str, float]], count: int) -> None:
+        """Remove the ``count`` oldest entries; IndexFlat renumbers remaining ids."""
+        import numpy as np
+
+        index.remove_ids(np.arange(count, dtype="int64"))
+        del contents[:count]
+
+    def _embed(self, text: str):
+        """Embed text as a normalized float32 row vector for cosine search."""
+        import numpy as np
+
+        vector = np.asarray(next(iter(self._embedder.embed([text]))), dtype="float32")
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        return vector.reshape(1, -1)
@@ -10,6 +10,8 @@ import subprocess
 import sys
 import threading
 import time
+from collections import deque
+from itertools import islice
 from pathlib import Path
 from typing import Dict, List, Optional
 
@@ -26,23 +28,52 @@ class PolyLlamaCLI:
         self.compose_file = self.built_dir / "docker-compose.yml"
         self.log_file = self.built_dir / "polyllama-compose-build.log"
 
+        # Result of the Docker probe, cached for the lifetime of the process
+        self._docker_ok: Optional[bool] = None
+
+        # Compose executable, resolved on first use
+        self._compose_base: Optional[List[str]] = None
+
         # Ensure built directory exists
         self.built_dir.mkdir(exist_ok=True)
 
     def check_docker(self) -> bool:
         """Check if Docker is running"""
+        if self._docker_ok is not None:
+            return self._docker_ok
+
         try:
+            # Asking only for the server version is far cheaper than
+            # `docker info`, which collects the daemon's full system state
             subprocess.run(
-                ["docker", "info"],
+                ["docker", "version", "--format", "{{.Server.Version}}"],
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
                 check=True,
             )
-            return True
+            self._docker_ok = True
         except subprocess.CalledProcessError:
             print("Error: Docker is not running or not accessible")
             print("Please start Docker and try again")
-            return False
+            self._docker_ok = False
+        return self._docker_ok
+
+    def compose_cmd(self, *args: str) -> List[str]:
+        """Build a compose command for the generated compose file"""
+        if self._compose_base is None:
+            # Prefer the Compose v2 plugin (a Go binary) over the much slower
+            # to start Python docker-compose v1
+            try:
+                subprocess.run(
+                    ["docker", "compose", "version"],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    check=True,
+                )
+                self._compose_base = ["docker", "compose"]
+            except (subprocess.CalledProcessError, FileNotFoundError):
+                self._compose_base = ["docker-compose"]
+        return [*self._compose_base, "-f", str(self.compose_file), *args]
 
     def check_env_file(self):
         """Check and create .env file if needed"""
@@ -52,8 +83,7 @@ class PolyLlamaCLI:
         if not env_file.exists():
             if env_example.exists():
                 print("📄 .env file not found, copying from .env.example...")
-                env_example.read_text()
-                env_file.write_text(env_example.read_text())
+                env_file.write_bytes(env_example.read_bytes())
                 print("✅ Created .env file from .env.example")
                 print("💡 You may want to edit .env to customize your configuration")
             else:
@@ -194,66 +224,67 @@ class PolyLlamaCLI:
         print(f"  Ollama instances: {config['instance_count']}")
         print(f"  Generated file: {self.compose_file}")
 
-        # Stop any existing services
+        # Stop any existing services in the background; pulling images doesn't
+        # touch running containers, so the two overlap until the build
         print("🛑 Stopping any existing services...")
-        subprocess.run(
-            [
-                "docker-compose",
-                "-f",
-                str(self.compose_file),
-                "down",
-                "--remove-orphans",
-            ],
+        down_proc = subprocess.Popen(
+            self.compose_cmd("down", "--remove-orphans"),
+            stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
         )
 
-        # Pull latest images
-        print("📦 Pulling latest images...")
-        if debug:
-            print("   Debug mode: showing output on console")
-            subprocess.run(["docker-compose", "-f", str(self.compose_file), "pull"])
-        else:
-            print(f"   Output logged to: {self.log_file}")
-            print("   ┌─ Pull Progress ──────────────────────────────────────────────────────")
-            print("   │")
-            print("   │")
-            print("   │")
+        try:
+            # Pull latest images
+            print("📦 Pulling latest images...")
+            if debug:
+                print("   Debug mode: showing output on console")
+                subprocess.run(self.compose_cmd("pull"))
+            else:
+                print(f"   Output logged to: {self.log_file}")
+                print("   ┌─ Pull Progress ──────────────────────────────────────────────────────")
+                print("   │")
+                print("   │")
+                print("   │")
             
-            # Start the tail thread
-            stop_event = threading.Event()
-            tail_thread = threading.Thread(target=self.tail_log_file, args=(stop_event,))
-            tail_thread.daemon = True
-            tail_thread.start()
+                # Start the tail thread
+                stop_event = threading.Event()
+                tail_thread = threading.Thread(target=self.tail_log_file, args=(stop_event,))
+                tail_thread.daemon = True
+                tail_thread.start()
             
-            # Run the pull command
-            with open(self.log_file, "w") as log:
-                subprocess.run(
-                    ["docker-compose", "-f", str(self.compose_file), "pull"],
-                    stdout=log,
-                    stderr=subprocess.STDOUT,
-                )
+                # Run the pull command
+                with open(self.log_file, "w") as log:
+                    subprocess.run(
+                        self.compose_cmd("pull"),
+                        stdout=log,
+                        stderr=subprocess.STDOUT,
+                    )
             
-            # Stop the tail thread
-            stop_event.set()
-            tail_thread.join(timeout=1)
+                # Stop the tail thread
+                stop_event.set()
+                tail_thread.join(timeout=1)
             
-            # Clear the progress display
-            print("\033[3A", end="", flush=True)
-            for _ in range(3):
-                print("\033[2K", end="", flush=True)
-                print("\033[1B", end="", flush=True)
-            print("\r   └──────────────────────────────────────────────────────────────────────", flush=True)
-
-        # Build services
+                # Clear the progress display
+                print("\033[3A", end="", flush=True)
+                for _ in range(3):
+                    print("\033[2K", end="", flush=True)
+                    print("\033[1B", end="", flush=True)
+                print("\r   └──────────────────────────────────────────────────────────────────────", flush=True)
+        finally:
+            # Reap the background "down" even if the pull fails or is interrupted
+            down_proc.wait()
+
+        # Build services; BuildKit builds independent services in parallel
         print("🔨 Building services...")
-        build_cmd = ["docker-compose", "-f", str(self.compose_file), "build"]
+        build_env = {"DOCKER_BUILDKIT": "1", "COMPOSE_DOCKER_CLI_BUILD": "1", **os.environ}
+        build_cmd = self.compose_cmd("build")
         if build:
             print("   Force rebuild: --no-cache enabled")
             build_cmd.append("--no-cache")
 
         if debug:
             print("   Debug mode: showing output on console")
-            result = subprocess.run(build_cmd)
+            result = subprocess.run(build_cmd, env=build_env)
         else:
             print(
                 f"   This may take a few minutes... output logged to: {self.log_file}"
@@ -271,7 +302,9 @@ class PolyLlamaCLI:
             
             # Run the build command
             with open(self.log_file, "a") as log:
-                result = subprocess.run(build_cmd, stdout=log, stderr=subprocess.STDOUT)
+                result = subprocess.run(
+                    build_cmd, stdout=log, stderr=subprocess.STDOUT, env=build_env
+                )
             
             # Stop the tail thread
             stop_event.set()
@@ -290,8 +323,7 @@ class PolyLlamaCLI:
             print("")
             print("📋 Last 10 lines of build log:")
             with open(self.log_file, "r") as log:
-                lines = log.readlines()
-                for line in lines[-10:]:
+                for line in deque(log, maxlen=10):
                     print(line.rstrip())
             return 1
         else:
@@ -299,7 +331,7 @@ class PolyLlamaCLI:
 
         # Start services
         print("▶️  Starting services...")
-        up_cmd = ["docker-compose", "-f", str(self.compose_file), "up", "-d"]
+        up_cmd = self.compose_cmd("up", "-d")
         if build:
             up_cmd.append("--build")
         subprocess.run(up_cmd)
@@ -327,7 +359,7 @@ class PolyLlamaCLI:
             print("💡 Edit files in stack/polyllama/ui/ for hot reloading")
         print("")
         print("📋 Service Status:")
-        subprocess.run(["docker-compose", "-f", str(self.compose_file), "ps"])
+        subprocess.run(self.compose_cmd("ps"))
         print("")
         print("💡 Commands:")
         print("  📜 View logs: ./polyllama.sh --logs")
@@ -352,13 +384,7 @@ class PolyLlamaCLI:
         if self.compose_file.exists():
             print(f"  Stopping services from {self.compose_file}...")
             subprocess.run(
-                [
-                    "docker-compose",
-                    "-f",
-                    str(self.compose_file),
-                    "down",
-                    "--remove-orphans",
-                ],
+                self.compose_cmd("down", "--remove-orphans"),
                 stderr=subprocess.DEVNULL,
             )
 
@@ -375,22 +401,13 @@ class PolyLlamaCLI:
         if self.compose_file.exists():
             # Check if services are running
             result = subprocess.run(
-                ["docker-compose", "-f", str(self.compose_file), "ps", "--services"],
+                self.compose_cmd("ps", "--services"),
                 capture_output=True,
                 text=True,
             )
             if result.stdout.strip():
                 print(f"  Logs from {self.compose_file}:")
-                subprocess.run(
-                    [
-                        "docker-compose",
-                        "-f",
-                        str(self.compose_file),
-                        "logs",
-                        "--tail=50",
-                        "-f",
-                    ]
-                )
+                subprocess.run(self.compose_cmd("logs", "--tail=50", "-f"))
                 return 0
 
         print("❌ No running services found")
@@ -407,7 +424,7 @@ class PolyLlamaCLI:
             print("")
             print(f"  From {self.compose_file}:")
             result = subprocess.run(
-                ["docker-compose", "-f", str(self.compose_file), "ps"],
+                self.compose_cmd("ps"),
                 capture_output=True,
                 text=True,
             )
@@ -455,8 +472,7 @@ class PolyLlamaCLI:
         print("📄 Generated Docker Compose Preview:")
         print("─────────────────────────────────────")
         with open(self.compose_file, "r") as f:
-            lines = f.readlines()[:50]
-            for line in lines:
+            for line in islice(f, 50):
                 print(f"  {line.rstrip()}")
         print("  ...")
         print("─────────────────────────────────────")
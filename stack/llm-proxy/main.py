@@ -119,7 +119,8 @@ def main():
         host=config.HOST,
         port=config.PORT,
         reload=config.DEBUG,
-        log_level="info"
+        log_level="info",
+        loop="uvloop"
     )
 
 
@@ -12,6 +12,7 @@ from unittest import mock
 from unittest.mock import MagicMock
 import sys
 import io
+import subprocess
 
 # Add parent directory to path to import builder modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -230,7 +231,7 @@ class TestCLIIntegration:
 
     def test_launch_with_log_tailing(self, tmp_path):
         """Test that launch uses log tailing for non-debug mode"""
-        with mock.patch("subprocess.run") as mock_run:
+        with mock.patch("subprocess.run") as mock_run, mock.patch("subprocess.Popen"):
             with mock.patch("builder.detector.GPUDetector.detect_gpu_groups") as mock_detect:
                 # Mock GPU detection
                 mock_detect.return_value = [{"name": "RTX 3090", "indices": [0]}]
@@ -240,6 +241,7 @@ class TestCLIIntegration:
 
                 # Create CLI instance with temp paths
                 cli = PolyLlamaCLI()
+                cli.check_env_file = MagicMock()  # keep .env out of the repo root
                 cli.built_dir = tmp_path / "built"
                 cli.built_dir.mkdir()
                 cli.compose_file = cli.built_dir / "docker-compose.yml"
@@ -270,7 +272,7 @@ class TestCLIIntegration:
 
     def test_launch_debug_no_tailing(self, tmp_path):
         """Test that debug mode doesn't use log tailing"""
-        with mock.patch("subprocess.run") as mock_run:
+        with mock.patch("subprocess.run") as mock_run, mock.patch("subprocess.Popen"):
             with mock.patch("builder.detector.GPUDetector.detect_gpu_groups") as mock_detect:
                 # Mock GPU detection
                 mock_detect.return_value = [{"name": "RTX 3090", "indices": [0]}]
@@ -280,6 +282,7 @@ class TestCLIIntegration:
 
                 # Create CLI instance with temp paths
                 cli = PolyLlamaCLI()
+                cli.check_env_file = MagicMock()  # keep .env out of the repo root
                 cli.built_dir = tmp_path / "built"
                 cli.built_dir.mkdir()
                 cli.compose_file = cli.built_dir / "docker-compose.yml"
@@ -307,3 +310,165 @@ class TestCLIIntegration:
                 assert (
                     not tail_thread_created
                 ), "Log tailing thread should not be created in debug mode"
+
+    def test_launch_stops_services_before_build(self, tmp_path):
+        """Test that the background `down` is awaited before building"""
+        calls = []
+
+        def mock_run_fn(cmd, *args, **kwargs):
+            calls.append(("run", cmd[-1]))
+            return MagicMock(returncode=0, stdout="", stderr="")
+
+        down_proc = MagicMock()
+        down_proc.wait.side_effect = lambda: calls.append(("wait", "down"))
+
+        with mock.patch("subprocess.run", side_effect=mock_run_fn):
+            with mock.patch("subprocess.Popen", return_value=down_proc) as mock_popen:
+                with mock.patch("builder.detector.GPUDetector.detect_gpu_groups") as mock_detect:
+                    mock_detect.return_value = []
+
+                    cli = PolyLlamaCLI()
+
+                    cli.check_env_file = MagicMock()  # keep .env out of the repo root
+                    cli.built_dir = tmp_path / "built"
+                    cli.built_dir.mkdir()
+                    cli.compose_file = cli.built_dir / "docker-compose.yml"
+                    cli.log_file = cli.built_dir / "test.log"
+
+                    with mock.patch("builtins.print"):
+                        cli.launch(debug=True)
+
+        assert mock_popen.call_args[0][0][-2:] == ["down", "--remove-orphans"]
+        assert calls.index(("wait", "down")) < calls.index(("run", "build"))
+
+
+class TestDockerCheck:
+    """Test the Docker availability probe"""
+
+    def test_check_docker_probes_once(self):
+        """Test that the probe uses `docker version` and is cached"""
+        with mock.patch("subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(returncode=0)
+
+            cli = PolyLlamaCLI()
+            assert cli.check_docker()
+            assert cli.check_docker()
+
+            mock_run.assert_called_once()
+            assert mock_run.call_args[0][0][:2] == ["docker", "version"]
+
+    def test_check_docker_not_running(self):
+        """Test that a failed probe reports Docker as unavailable"""
+        with mock.patch("subprocess.run") as mock_run:
+            mock_run.side_effect = subprocess.CalledProcessError(1, "docker")
+
+            cli = PolyLlamaCLI()
+            with mock.patch("builtins.print"):
+                assert not cli.check_docker()
+                assert not cli.check_docker()
+
+            mock_run.assert_called_once()
+
+
+class TestEnvFile:
+    """Test .env file creation"""
+
+    def test_check_env_file_copies_example(self, tmp_path):
+        """Test that a missing .env is created from .env.example"""
+        cli = PolyLlamaCLI()
+        cli.root_dir = tmp_path
+        (tmp_path / ".env.example").write_text("OLLAMA_PORT=11434\n")
+
+        with mock.patch("builtins.print"):
+            cli.check_env_file()
+
+        assert (tmp_path / ".env").read_text() == "OLLAMA_PORT=11434\n"
+
+    def test_check_env_file_keeps_existing(self, tmp_path):
+        """Test that an existing .env is left untouched"""
+        cli = PolyLlamaCLI()
+        cli.root_dir = tmp_path
+        (tmp_path / ".env.example").write_text("OLLAMA_PORT=11434\n")
+        (tmp_path / ".env").write_text("OLLAMA_PORT=8080\n")
+
+        with mock.patch("builtins.print"):
+            cli.check_env_file()
+
+        assert (tmp_path / ".env").read_text() == "OLLAMA_PORT=8080\n"
+
+
+class TestOutputPreviews:
+    """Test the compose file preview and build log excerpt"""
+
+    def test_detect_previews_first_50_lines(self, tmp_path):
+        """Test that detect prints only the head of the compose file"""
+        cli = PolyLlamaCLI()
+        cli.compose_file = tmp_path / "docker-compose.yml"
+        cli.compose_file.write_text("".join(f"line {i}\n" for i in range(1, 61)))
+
+        config = {
+            "gpu_groups": [],
+            "instance_count": 1,
+            "gpu_count": 0,
+            "config_type": "cpu-only",
+            "dev_mode": False,
+        }
+        with mock.patch.object(cli, "detect_and_generate", return_value=config):
+            with mock.patch("builtins.print") as mock_print:
+                cli.detect()
+
+        printed = [str(call.args[0]) for call in mock_print.call_args_list if call.args]
+        assert "  line 50" in printed
+        assert "  line 51" not in printed
+
+    def test_launch_build_failure_shows_last_10_log_lines(self, tmp_path):
+        """Test that a failed build prints the tail of the build log"""
+        with mock.patch("subprocess.run") as mock_run, mock.patch("subprocess.Popen"):
+            with mock.patch("builder.detector.GPUDetector.detect_gpu_groups") as mock_detect:
+                mock_detect.return_value = []
+                mock_run.return_value = MagicMock(returncode=1, stdout="", stderr="")
+
+                cli = PolyLlamaCLI()
+
+                cli.check_env_file = MagicMock()  # keep .env out of the repo root
+                cli.built_dir = tmp_path / "built"
+                cli.built_dir.mkdir()
+                cli.compose_file = cli.built_dir / "docker-compose.yml"
+                cli.log_file = cli.built_dir / "test.log"
+                cli.log_file.write_text("".join(f"log {i}\n" for i in range(1, 21)))
+
+                with mock.patch("builtins.print") as mock_print:
+                    assert cli.launch(debug=True) == 1
+
+        printed = [str(call.args[0]) for call in mock_print.call_args_list if call.args]
+        assert "log 11" in printed
+        assert "log 20" in printed
+        assert "log 10" not in printed
+
+
+class TestComposeCommand:
+    """Test selection of the compose executable"""
+
+    def test_compose_cmd_prefers_v2_plugin(self):
+        """Test that `docker compose` is used when available, detected once"""
+        with mock.patch("subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(returncode=0)
+
+            cli = PolyLlamaCLI()
+            cmd = cli.compose_cmd("ps")
+            cli.compose_cmd("logs")
+
+            assert cmd == ["docker", "compose", "-f", str(cli.compose_file), "ps"]
+            mock_run.assert_called_once()
+
+    def test_compose_cmd_falls_back_to_v1(self):
+        """Test that docker-compose is used when the v2 plugin is missing"""
+        with mock.patch("subprocess.run") as mock_run:
+            mock_run.side_effect = subprocess.CalledProcessError(1, "docker")
+
+            cli = PolyLlamaCLI()
+            cmd = cli.compose_cmd("down", "--remove-orphans")
+
+            assert cmd == [
+                "docker-compose", "-f", str(cli.compose_file), "down", "--remove-orphans"
+            ]